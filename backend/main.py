@@ -2,21 +2,45 @@ import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from apscheduler.schedulers.background import BackgroundScheduler
-from tasks.report import generate_report
+from tasks.report import generate_report, generate_report_batch, load_report_preferences
+from tasks.jobs import submit_job, get_job
+from tasks.report_index import latest_report, list_reports, get_report, read_artefact
+from tasks.audio import DEFAULT_VOICE, render_report_audio, transcribe_report
+from tasks.retention import apply_retention
+from tasks.scheduler import start_scheduler, stop_scheduler, schedule_profiles
 from tools.tools import TOOL_MAPPING, TOOL_DEFS
+from utils.rate_limit import rate_limit_metrics
+from utils.hedging import hedging_metrics
+from utils.router import router_metrics
+from utils.llm import completion_cache_metrics, close_clients
 from fastapi.responses import StreamingResponse
 from services.tts import text_to_speech, get_available_voices
 from pydantic import BaseModel
-import glob
+import hashlib
 import io
+import queue
+import uuid
 import os
 import json
 
 
-app = FastAPI()
+# Prepare each profile's report, audio and transcript ahead of its listening time
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SCHEDULER_ENABLED:
+        start_scheduler()
+    yield
+    stop_scheduler()
+    close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class TTSRequest(BaseModel):
@@ -40,28 +64,163 @@ app.add_middleware(
 )
 
 
-# @app.on_event("startup")
-# def start_scheduler():
-#     scheduler = BackgroundScheduler()
-#     scheduler.add_job(generate_report, 'interval', minutes=60)
-#     scheduler.start()
+def submit_report_job():
+    """Queue a report run. Runs with identical personalization coalesce into one job."""
+    prefs = json.dumps(load_report_preferences(), sort_keys=True)
+    key = "report:" + hashlib.sha256(prefs.encode("utf-8")).hexdigest()
+    return submit_job(key, generate_report)
 
 
 @app.post("/generate-report")
 def trigger_generate_report():
-    return {"report": generate_report()}
+    """Generate a report and wait for it. Prefer /reports/jobs for a non-blocking run."""
+    job = submit_report_job()
+    return {"report": job.future.result()}
+
+
+@app.get("/generate-report/stream")
+def stream_generate_report():
+    """
+    Generate a report, streaming progress as server-sent events: tool_started,
+    tool_finished, llm_iteration, llm_finished, token and report_saved, then
+    a final done (with the report) or error event. Token events of an iteration
+    that ends in tool calls are not part of the report.
+    """
+    events = queue.Queue()
+    job = submit_job(f"stream:{uuid.uuid4().hex}", generate_report,
+                     on_event=lambda event_type, data: events.put((event_type, data)))
+    job.future.add_done_callback(lambda _: events.put(None))
+
+    def event_stream():
+        yield f"event: job\ndata: {json.dumps(job.to_dict())}\n\n"
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            event_type, data = item
+            yield f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        if job.status == "succeeded":
+            yield f"event: done\ndata: {json.dumps({'report': job.result}, ensure_ascii=False)}\n\n"
+        else:
+            yield f"event: error\ndata: {json.dumps({'error': job.error})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/reports/jobs")
+def create_report_job():
+    """Start generating a report in the background and return its job ID immediately."""
+    return submit_report_job().to_dict()
+
+
+@app.post("/reports/batch")
+def create_report_batch_job(profiles: list[dict]):
+    """
+    Start generating one report per personalization dict in the background.
+    Tool data shared between the profiles is fetched once. The job's result
+    is the list of reports in the same order.
+    """
+    if not profiles:
+        return {"error": "No profiles given."}
+    key = "batch:" + hashlib.sha256(json.dumps(profiles, sort_keys=True).encode("utf-8")).hexdigest()
+    return submit_job(key, generate_report_batch, profiles).to_dict()
+
+
+@app.get("/reports/jobs/{job_id}")
+def get_report_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return {"error": f"Job {job_id} not found."}
+    return job.to_dict()
+
+
+@app.get("/reports/jobs/{job_id}/result")
+def get_report_job_result(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return {"error": f"Job {job_id} not found."}
+    if job.status == "failed":
+        return {"error": job.error, **job.to_dict()}
+    if not job.done:
+        return job.to_dict()
+    return {"report": job.result, **job.to_dict()}
 
 
 @app.get("/latest-report")
 def get_latest_report():
-    list_of_files = glob.glob('reports/*.txt')
-    print(list_of_files)
-    if not list_of_files:
+    latest = latest_report()
+    if latest is None:
         return {"error": "No reports found."}
-    latest_file = max(list_of_files, key=os.path.getctime)
-    with open(latest_file, 'r') as f:
-        content = f.read()
-    return {"report": content}
+    return {"report": read_artefact(latest["report"])}
+
+
+@app.get("/reports")
+def get_reports(limit: int = 20, offset: int = 0):
+    """Indexed reports newest first, with the paths of their audio, transcript and trace."""
+    return {"reports": list_reports(limit, offset)}
+
+
+@app.post("/reports/retention")
+def run_retention():
+    """Archive or delete report artefacts beyond their retention limits and report the space reclaimed."""
+    return apply_retention()
+
+
+@app.get("/traces")
+def list_traces(limit: int = 20):
+    """Summaries of the most recent report traces, newest first."""
+    trace_files = [record["trace"] for record in list_reports(limit, having="trace")]
+    summaries = []
+    for trace_file in trace_files:
+        try:
+            trace = json.loads(read_artefact(trace_file))
+        except (OSError, KeyError, json.JSONDecodeError):
+            continue
+        summaries.append({
+            "report": trace.get("report"),
+            "started_at": trace.get("started_at"),
+            "model": trace.get("model"),
+            "provider": trace.get("provider"),
+            "totals": trace.get("totals"),
+        })
+    return {"traces": summaries}
+
+
+@app.get("/traces/{report_name}")
+def get_trace(report_name: str):
+    """Full trace of one report run, e.g. /traces/report-2025-01-01_08-00-00."""
+    record = get_report(os.path.basename(report_name))
+    if record is None or not record.get("trace"):
+        return {"error": f"No trace found for {report_name}."}
+    return json.loads(read_artefact(record["trace"]))
+
+
+@app.get("/llm/rate-limits")
+def get_rate_limits():
+    """Queue depth, wait times and remaining quota of each LLM provider and model."""
+    return {"limiters": rate_limit_metrics()}
+
+
+@app.get("/llm/hedging")
+def get_hedging_stats():
+    """How often completions were hedged to the secondary provider and which provider answered first."""
+    return hedging_metrics()
+
+
+@app.get("/llm/router")
+def get_router_health():
+    """Latency average, error rate and circuit state of each LLM endpoint, in routing order."""
+    return {"endpoints": router_metrics()}
+
+
+@app.get("/llm/completion-cache")
+def get_completion_cache_stats():
+    """Hits and misses of the exact-match LLM completion cache."""
+    return completion_cache_metrics()
 
 
 @app.get("/tools")
@@ -109,9 +268,14 @@ def set_personalization(prefs: dict):
     try:
         with open(prefs_path, "w") as f:
             json.dump(prefs, f, indent=4)
-        return {"status": "ok"}
     except Exception as e:
         return {"error": str(e)}
+    # The personalization is saved even if its editions cannot be rescheduled
+    try:
+        schedule_profiles()
+    except Exception as e:
+        print(f"[scheduler] Could not reschedule editions: {e}")
+    return {"status": "ok"}
 
 
 @app.post("/tools/{tool_name}")
@@ -138,40 +302,13 @@ def generate_tts(request: TTSRequest):
     except Exception as e:
         return {"error": str(e)}
     
-def transcribe_report(report_name: str):
-    """Helper function to transcribe an audio file given its path."""
-    # First check if transcription already exists
-    audio_path = f'reports/audio/{report_name}.mp3'
-    transcript_path = f'reports/transcripts/{report_name}.json'
-    if os.path.exists(transcript_path):
-        with open(transcript_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-
-    try:
-        with open(audio_path, 'rb') as f:
-            audio_bytes = f.read()
-        
-        from services.stt import create_transcription
-        transcription = create_transcription(audio_bytes)
-        # Save transcription as JSON
-        os.makedirs('reports/transcripts', exist_ok=True)
-        with open(transcript_path, 'w', encoding='utf-8') as f:
-            f.write(transcription.json())
-
-        return transcription
-    except Exception as e:
-        raise Exception(f"Error transcribing audio file: {str(e)}")
-    
 @app.post("/transcribe-latest")
 def transcribe_audio():
-    """Transcribe the latest audio file in the 'reports/audio' directory."""
-    import glob
-    list_of_files = glob.glob('reports/audio/*')
-    if not list_of_files:
+    """Transcribe the audio of the latest report that has audio."""
+    with_audio = list_reports(limit=1, having="audio")
+    if not with_audio:
         return {"error": "No audio files found."}
-    latest_file = max(list_of_files, key=os.path.getctime)
-    report_name = os.path.splitext(os.path.basename(latest_file))[0]
-    return transcribe_report(report_name)
+    return transcribe_report(with_audio[0]["id"])
 
 @app.post("/tts/sample")
 def generate_sample_tts(request: TTSSampleRequest):
@@ -194,49 +331,28 @@ def generate_report_tts():
     audio_bytes = None
 
     # Check for latest report
-    import glob
-    list_of_files = glob.glob('reports/*.txt')
-    if not list_of_files:
+    latest = latest_report()
+    if latest is None:
         return {"error": "No reports found."}
 
-    latest_file = max(list_of_files, key=os.path.getctime)
-
-    # Check if audio already exists for this report
-    audio_file_path = latest_file.replace(
-        '.txt', '.mp3').replace('reports/', 'reports/audio/')
-    if os.path.exists(audio_file_path):
-        with open(audio_file_path, 'rb') as f:
-            audio_bytes = f.read()
-    else:
-        print("Generating new TTS for report:", latest_file)
-        with open(latest_file, 'r') as f:
-            content = f.read()
-
-        # Load personalization to get the saved voice
-        user_voice = "21m00Tcm4TlvDq8ikWAM" # Default (Rachel)
-        prefs_path = os.path.join(os.path.dirname(__file__), "report_personalization.json")
-        
-        if os.path.exists(prefs_path):
-            try:
-                with open(prefs_path, "r") as f:
-                    prefs = json.load(f)
-                    user_voice = prefs.get("voice", user_voice)
-            except Exception as e:
-                logging.warning(f"Could not load voice from personalization, using default: {e}")
-        
+    # Load personalization to get the saved voice
+    user_voice = DEFAULT_VOICE
+    prefs_path = os.path.join(os.path.dirname(__file__), "report_personalization.json")
+
+    if os.path.exists(prefs_path):
         try:
-            # Pass the user_voice to the TTS function
-            audio_bytes = text_to_speech(content, voice=user_voice)
-
-            # Save audio to file
-            os.makedirs('reports/audio', exist_ok=True)
-            audio_filename = latest_file.replace(
-                '.txt', '.mp3').replace('reports/', 'reports/audio/')
-            with open(audio_filename, 'wb') as audio_file:
-                audio_file.write(audio_bytes)
+            with open(prefs_path, "r") as f:
+                prefs = json.load(f)
+                user_voice = prefs.get("voice", user_voice)
         except Exception as e:
-            print("Error generating TTS:", e)
-            return {"error": str(e)}
+            logging.warning(f"Could not load voice from personalization, using default: {e}")
+
+    try:
+        # Reads the pre-rendered audio if the scheduler already made it
+        audio_bytes = render_report_audio(latest["id"], latest["report"], voice=user_voice)
+    except Exception as e:
+        print("Error generating TTS:", e)
+        return {"error": str(e)}
 
     return StreamingResponse(
         io.BytesIO(audio_bytes),
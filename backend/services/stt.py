@@ -1,8 +1,5 @@
-import json
-import os
-from elevenlabs.client import ElevenLabs
 from elevenlabs import SpeechToTextChunkResponseModel
-from dotenv import load_dotenv
+from services.tts import get_elevenlabs_client
 
 def create_transcription(audio_bytes: bytes) -> SpeechToTextChunkResponseModel:
     """
@@ -15,9 +12,7 @@ def create_transcription(audio_bytes: bytes) -> SpeechToTextChunkResponseModel:
     Returns:
         bytes: The original audio bytes.
     """
-    load_dotenv()
-    api_key = os.getenv("ELEVENLABS_API_KEY")
-    client = ElevenLabs(api_key=api_key)
+    client = get_elevenlabs_client()
 
     try:
         # Try create transcript
@@ -1,10 +1,22 @@
 import os
-from elevenlabs.client import ElevenLabs
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_elevenlabs_client():
+    """Return the shared ElevenLabs client, importing the SDK and creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from elevenlabs.client import ElevenLabs
+                _client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+    return _client
 
 def text_to_speech(text: str, voice: str = "21m00Tcm4TlvDq8ikWAM", output_path: str = None) -> bytes:
     """
@@ -32,7 +44,7 @@ def text_to_speech(text: str, voice: str = "21m00Tcm4TlvDq8ikWAM", output_path:
         }
         
         voice_id = voice_map.get(voice, voice)
-        audio_generator = client.text_to_speech.convert(
+        audio_generator = get_elevenlabs_client().text_to_speech.convert(
             text=text,
             voice_id=voice_id,
             model_id="eleven_multilingual_v2",
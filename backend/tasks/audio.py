@@ -0,0 +1,52 @@
+import os
+import json
+
+from services.tts import text_to_speech
+from tasks.report_index import (
+    AUDIO_DIR, TRANSCRIPTS_DIR, audio_path, transcript_path, get_report, read_artefact, update_report,
+)
+
+DEFAULT_VOICE = "21m00Tcm4TlvDq8ikWAM"  # Rachel
+
+
+def render_report_audio(report_id: str, report_file: str, voice: str = DEFAULT_VOICE) -> bytes:
+    """Return the report's audio, generating and saving it under reports/audio/ if it does not exist yet."""
+    audio_file_path = audio_path(report_id)
+    if os.path.exists(audio_file_path):
+        with open(audio_file_path, 'rb') as f:
+            return f.read()
+
+    print("Generating new TTS for report:", report_file)
+    audio_bytes = text_to_speech(read_artefact(report_file), voice=voice)
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    with open(audio_file_path, 'wb') as audio_file:
+        audio_file.write(audio_bytes)
+    update_report(report_id, audio=audio_file_path)
+    return audio_bytes
+
+
+def transcribe_report(report_id: str):
+    """Return the transcript of a report's audio, creating it with speech-to-text if it does not exist yet."""
+    record = get_report(report_id)
+    if record and record.get("transcript"):
+        return json.loads(read_artefact(record["transcript"]))
+    report_transcript_path = transcript_path(report_id)
+    if os.path.exists(report_transcript_path):
+        with open(report_transcript_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    try:
+        with open(audio_path(report_id), 'rb') as f:
+            audio_bytes = f.read()
+
+        from services.stt import create_transcription
+        transcription = create_transcription(audio_bytes)
+        # Save transcription as JSON
+        os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
+        with open(report_transcript_path, 'w', encoding='utf-8') as f:
+            f.write(transcription.json())
+        update_report(report_id, transcript=report_transcript_path)
+
+        return transcription
+    except Exception as e:
+        raise Exception(f"Error transcribing audio file: {str(e)}")
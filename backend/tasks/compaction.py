@@ -0,0 +1,193 @@
+import os
+import json
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# Rough size limits for tool results fed to the LLM, in estimated tokens.
+TOOL_TOKEN_BUDGET = int(os.getenv("PROMPT_TOOL_TOKEN_BUDGET", "1500"))
+TOTAL_TOKEN_BUDGET = int(os.getenv("PROMPT_TOTAL_TOKEN_BUDGET", "6000"))
+
+# Characters per token; close enough for English and Finnish JSON without a tokenizer.
+_CHARS_PER_TOKEN = 4
+_TRUNCATED = "...[truncated]"
+# Below this many tokens of total budget left, a tool result is omitted rather than cut to a stub.
+_MIN_ALLOWANCE = 32
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+# -------------------------
+# Per-tool projections
+# -------------------------
+
+def _project_weather(data: dict) -> dict:
+    main = data.get("main", {})
+    return {
+        "city": data.get("name"),
+        "conditions": ", ".join(w.get("description", "") for w in data.get("weather", [])),
+        "temp": main.get("temp"),
+        "feels_like": main.get("feels_like"),
+        "temp_min": main.get("temp_min"),
+        "temp_max": main.get("temp_max"),
+        "humidity": main.get("humidity"),
+        "wind_speed": data.get("wind", {}).get("speed"),
+    }
+
+
+def _project_news(data: dict) -> dict:
+    return {
+        "items": [
+            {
+                "title": item.get("title"),
+                "link": item.get("link"),
+                "summary": item.get("summary"),
+                "published_at": item.get("published_at"),
+            }
+            for item in data.get("items", [])
+        ]
+    }
+
+
+def _project_unicafe(data: list) -> list:
+    restaurants = []
+    for restaurant in data:
+        menus = []
+        for menu in restaurant.get("menus", []):
+            dishes = menu.get("data")
+            if isinstance(dishes, list) and all(isinstance(d, dict) and "name" in d for d in dishes):
+                menus.append({"date": menu.get("date"), "dishes": [d["name"] for d in dishes]})
+            else:
+                menus.append(menu)
+        restaurants.append({
+            "name": restaurant.get("name"),
+            "visitingHours": restaurant.get("visitingHours"),
+            "menus": menus,
+        })
+    return restaurants
+
+
+def _project_local_events(data: dict) -> dict:
+    return {
+        "city": data.get("city"),
+        "summary": data.get("summary"),
+        "events": [
+            {k: event.get(k) for k in ("name", "venue", "category", "date", "time", "price", "url")}
+            for event in data.get("events", [])
+        ],
+    }
+
+
+def _project_stadissa(data: dict) -> dict:
+    return {
+        "status": data.get("status"),
+        "summary": data.get("summary") or data.get("message"),
+        "events": [
+            {k: event.get(k) for k in ("title", "venue", "url")}
+            for event in data.get("events", [])
+        ],
+    }
+
+
+# Reduce each tool's result to the fields a report needs. Results the
+# projection does not recognise (errors, article text) are passed through.
+PROJECTIONS: Dict[str, Callable[[Any], Any]] = {
+    "get_weather": _project_weather,
+    "yle_news": _project_news,
+    "get_unicafe_menu": _project_unicafe,
+    "local_events_tool": _project_local_events,
+    "stadissa_tool": _project_stadissa,
+}
+
+# The key a tool's result has when it is the data PROJECTIONS expects, or
+# list for tools that return a list.
+EXPECTED_SHAPES: Dict[str, Any] = {
+    "get_weather": "main",
+    "yle_news": "items",
+    "get_unicafe_menu": list,
+    "local_events_tool": "events",
+    "stadissa_tool": "status",
+}
+
+
+def _recognised(tool_name: str, value: Any) -> bool:
+    shape = EXPECTED_SHAPES.get(tool_name)
+    if shape is list:
+        return isinstance(value, list)
+    return isinstance(value, dict) and shape in value and "error" not in value
+
+
+def _drop_empty(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _drop_empty(v) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [_drop_empty(v) for v in value]
+    return value
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _longest_list(value: Any) -> Optional[list]:
+    """Find the longest list nested anywhere in value."""
+    longest = value if isinstance(value, list) else None
+    children = value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+    for child in children:
+        candidate = _longest_list(child)
+        if candidate is not None and (longest is None or len(candidate) > len(longest)):
+            longest = candidate
+    return longest
+
+
+def _fit(value: Any, max_tokens: int) -> str:
+    """Serialise value within max_tokens, dropping trailing list items first and truncating as a last resort."""
+    text = _dump(value)
+    while estimate_tokens(text) > max_tokens:
+        longest = _longest_list(value)
+        if longest is None or len(longest) <= 1:
+            break
+        del longest[(len(longest) + 1) // 2:]
+        text = _dump(value)
+    if estimate_tokens(text) > max_tokens:
+        text = text[:max(0, max_tokens * _CHARS_PER_TOKEN - len(_TRUNCATED))] + _TRUNCATED
+    return text
+
+
+def compact_tool_result(tool_name: str, result: Any, max_tokens: int = TOOL_TOKEN_BUDGET) -> str:
+    """Project a tool result to the fields the report needs and serialise it compactly within max_tokens."""
+    value = result
+    if isinstance(result, str):
+        try:
+            value = json.loads(result)
+        except json.JSONDecodeError:
+            return _fit(result, max_tokens) if estimate_tokens(result) > max_tokens else result
+
+    projection = PROJECTIONS.get(tool_name)
+    if projection is not None and _recognised(tool_name, value):
+        try:
+            value = projection(value)
+        except (AttributeError, TypeError):
+            pass
+    return _fit(_drop_empty(value), max_tokens)
+
+
+class TokenBudget:
+    """Total token budget shared by the tool results of one report run."""
+
+    def __init__(self, total: int = TOTAL_TOKEN_BUDGET, per_tool: int = TOOL_TOKEN_BUDGET):
+        self.remaining = total
+        self.per_tool = per_tool
+        self._lock = threading.Lock()
+
+    def compact(self, tool_name: str, result: Any) -> str:
+        """Compact a tool result within both the per-tool budget and what is left of the total."""
+        with self._lock:
+            allowance = min(self.per_tool, self.remaining)
+        if allowance < _MIN_ALLOWANCE:
+            return f"[Token budget exhausted, data omitted for {tool_name}. Do not call it again.]"
+        text = compact_tool_result(tool_name, result, allowance)
+        with self._lock:
+            self.remaining -= estimate_tokens(text)
+        return text
@@ -0,0 +1,98 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+# Report jobs run in the background on a small bounded pool, so a burst of
+# submissions queues up instead of tying up request threads.
+MAX_CONCURRENT_JOBS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+# How many finished jobs are kept around for status and result lookups.
+MAX_FINISHED_JOBS = 100
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="report-job")
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_active_by_key: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+@dataclass
+class Job:
+    """A background job and its outcome."""
+
+    id: str
+    key: str
+    status: str = "queued"  # queued, running, succeeded or failed
+    submitted_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Any = None
+    error: Optional[str] = None
+    future: Future = field(default_factory=Future, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status of the job, without its result."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+
+def _run(job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict):
+    job.status = "running"
+    job.started_at = datetime.now(timezone.utc)
+    try:
+        job.result = fn(*args, **kwargs)
+        job.status = "succeeded"
+        job.future.set_result(job.result)
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+        job.future.set_exception(e)
+    finally:
+        job.finished_at = datetime.now(timezone.utc)
+        with _lock:
+            if _active_by_key.get(job.key) == job.id:
+                del _active_by_key[job.key]
+            _prune()
+
+
+def _prune():
+    """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS."""
+    finished = [job_id for job_id, job in _jobs.items() if job.done]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def submit_job(key: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+    """
+    Queue fn(*args, **kwargs) in the background and return its Job.
+    While a job with the same key is queued or running, that job is returned
+    instead of starting another one.
+    """
+    with _lock:
+        active_id = _active_by_key.get(key)
+        if active_id is not None:
+            return _jobs[active_id]
+
+        job = Job(id=uuid.uuid4().hex, key=key)
+        _jobs[job.id] = job
+        _active_by_key[key] = job.id
+    _executor.submit(_run, job, fn, args, kwargs)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.files import write_json_atomic
+
+# Fingerprints of recent report inputs, stored next to the reports themselves.
+MANIFEST_PATH = os.path.join("reports", "fingerprints.json")
+# A report whose inputs match exactly is reused if it is at most this old.
+MEMO_WINDOW = timedelta(minutes=float(os.getenv("REPORT_MEMO_WINDOW_MINUTES", "30")))
+
+# Fields that change on every fetch without the underlying data changing.
+_VOLATILE_KEYS = {"fetched_at", "timestamp"}
+
+_lock = threading.Lock()
+
+
+def _canonicalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _canonicalize(v) for k, v in value.items() if k not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_canonicalize(v) for v in value]
+    return value
+
+
+def canonical_tool_result(result: Any) -> str:
+    """Serialise a tool result so that equal data always gives the same string."""
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except json.JSONDecodeError:
+            return result
+    return json.dumps(_canonicalize(result), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def compute_report_fingerprint(
+    prefs: Dict[str, Any],
+    allowed_tools: List[str],
+    tool_results: Dict[str, Any],
+    today_str: str,
+) -> str:
+    """Hash of everything a report run is generated from."""
+    payload = {
+        "date": today_str,
+        "prefs": prefs,
+        "allowed_tools": sorted(allowed_tools),
+        "tool_results": {
+            name: hashlib.sha256(canonical_tool_result(result).encode("utf-8")).hexdigest()
+            for name, result in tool_results.items()
+        },
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _load_manifest() -> Dict[str, Dict[str, str]]:
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def find_memoized_report(fingerprint: str) -> Optional[Tuple[str, str]]:
+    """Return (file_name, content) of a report generated from the same inputs within the window."""
+    with _lock:
+        record = _load_manifest().get(fingerprint)
+    if record is None:
+        return None
+    created_at = datetime.fromisoformat(record["created_at"])
+    if datetime.now(timezone.utc) - created_at > MEMO_WINDOW:
+        return None
+    try:
+        with open(record["file"], "r") as f:
+            return record["file"], f.read()
+    except FileNotFoundError:
+        return None
+
+
+def record_report(fingerprint: str, file_name: str):
+    """Remember which report was generated from a fingerprint, dropping records older than the window."""
+    now = datetime.now(timezone.utc)
+    with _lock:
+        manifest = {
+            fp: record for fp, record in _load_manifest().items()
+            if now - datetime.fromisoformat(record["created_at"]) <= MEMO_WINDOW
+        }
+        manifest[fingerprint] = {"file": file_name, "created_at": now.isoformat()}
+        write_json_atomic(MANIFEST_PATH, manifest)
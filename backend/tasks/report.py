@@ -1,132 +1,340 @@
 import datetime
+import hashlib
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 from tasks.prompts import get_prompt_messages
+from tasks.compaction import TokenBudget, compact_tool_result
+from tasks.trace import RunTrace
+from tasks.report_index import add_report
+from tasks.retention import maybe_apply_retention
+from tasks.memo import compute_report_fingerprint, find_memoized_report, record_report, canonical_tool_result
 from dotenv import load_dotenv
+from openai.types.chat import ChatCompletionMessage
 
 from tools.tools import TOOLS
-from utils.llm import get_client_and_model
+from utils.router import route_chat_completion
+from utils.cache import configure_tool_cache, get_cached_response, get_or_fetch, FixedTTL
 
 load_dotenv()
 
-client, model = get_client_and_model()
+# Receives progress events as (event_type, data) while a report is generated.
+EventCallback = Callable[[str, dict], None]
 
 
-def call_llm(msgs, allowed_tool_defs):
-    response = client.chat.completions.create(
-        model=model,
+def _emit(on_event: Optional[EventCallback], event_type: str, **data):
+    if on_event is None:
+        return
+    try:
+        on_event(event_type, data)
+    except Exception as e:
+        print(f"Report event handler failed for {event_type}: {e}")
+
+
+def _usage_dict(usage) -> Optional[dict]:
+    if usage is None:
+        return None
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+
+def _stream_llm(msgs, allowed_tool_defs, on_event: EventCallback):
+    """
+    Run a streaming completion, emitting content tokens as they arrive.
+    Returns the assembled final message and its token usage.
+    """
+    stream, endpoint = route_chat_completion(
         tools=allowed_tool_defs,
-        messages=msgs
+        messages=msgs,
+        stream=True,
+        stream_options={"include_usage": True},
     )
-    message_dict = response.choices[0].message.dict()
+    content_parts = []
+    tool_calls = {}
+    usage = None
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = _usage_dict(chunk.usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content_parts.append(delta.content)
+            _emit(on_event, "token", text=delta.content)
+        for tool_call_delta in delta.tool_calls or []:
+            index = tool_call_delta.index if tool_call_delta.index is not None else len(tool_calls)
+            tool_call = tool_calls.setdefault(
+                index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+            if tool_call_delta.id:
+                tool_call["id"] = tool_call_delta.id
+            if tool_call_delta.function:
+                tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+
+    message = ChatCompletionMessage.model_validate({
+        "role": "assistant",
+        "content": "".join(content_parts) or None,
+        "tool_calls": [tool_calls[i] for i in sorted(tool_calls)] or None,
+    })
+    return message, {**(usage or {}), "provider": endpoint.provider, "model": endpoint.model}
+
+
+def call_llm(msgs, allowed_tool_defs, on_event: Optional[EventCallback] = None, stream: bool = False):
+    """
+    Run one LLM turn and append the assistant message to msgs.
+    Returns the message and its token usage, with the provider and model that answered. With stream=True, content tokens are emitted through on_event.
+    """
+    if not stream:
+        response, endpoint = route_chat_completion(
+            tools=allowed_tool_defs,
+            messages=msgs
+        )
+        message = response.choices[0].message
+        usage = {**(_usage_dict(response.usage) or {}), "provider": endpoint.provider, "model": endpoint.model}
+    else:
+        message, usage = _stream_llm(msgs, allowed_tool_defs, on_event)
+    message_dict = message.dict()
     # Remove keys with None values
     filtered_message = {k: v for k, v in message_dict.items() if v is not None}
     msgs.append(filtered_message)
-    return response
+    return message, usage
 
 
-def get_tool_response(tool_call, allowed_tool_mapping):
+def invoke_tool(tool_name: str, tool_fn, tool_args: dict, on_event: Optional[EventCallback] = None) -> str:
+    """Invoke a tool, emitting tool_started and tool_finished events around it."""
+    _emit(on_event, "tool_started", tool=tool_name, args=tool_args)
+    start = time.monotonic()
+    ok = False
+    try:
+        result = tool_fn(**tool_args)
+        ok = True
+        return result
+    finally:
+        _emit(on_event, "tool_finished", tool=tool_name, ok=ok,
+              duration_ms=round((time.monotonic() - start) * 1000))
+
+
+def get_tool_response(tool_call, allowed_tool_mapping, on_event: Optional[EventCallback] = None,
+                      budget: Optional[TokenBudget] = None):
     tool_name = tool_call.function.name
     tool_args = json.loads(tool_call.function.arguments)
     print(f"Calling tool {tool_name} with args {tool_args}")
-    tool_result = allowed_tool_mapping[tool_name](**tool_args)
+    tool_result = invoke_tool(tool_name, allowed_tool_mapping[tool_name], tool_args, on_event)
+    # Project the result to what the report needs and keep it within the token budget
+    if budget is not None:
+        content = budget.compact(tool_name, tool_result)
+    else:
+        content = compact_tool_result(tool_name, tool_result)
     return {
         "role": "tool",
         "tool_call_id": tool_call.id,
-        "content": json.dumps(tool_result),
+        "content": content,
     }
 
 
-def generate_report() -> str:
-    max_iterations = 10
-    iteration_count = 0
+# Tool calls requested in one LLM turn run concurrently, at most this many at a time.
+MAX_PARALLEL_TOOL_CALLS = int(os.getenv("REPORT_MAX_PARALLEL_TOOL_CALLS", "4"))
 
-    # Correct current date
-    today = datetime.datetime.now()
-    today_str = today.strftime("%A, %B %d, %Y")
+_tool_call_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_TOOL_CALLS, thread_name_prefix="report-tool-call")
 
-    # Load report preferences
-    preferences_path = os.path.join(os.path.dirname(__file__), "../report_personalization.json")
-    try:
-        with open(preferences_path, "r") as pref_file:
-            report_prefs_dict = json.load(pref_file)
-    except Exception as e:
-        report_prefs_dict = {}
 
-    report_prefs = ""
-    allowed_tools = []
-    if report_prefs_dict:
-        for key, value in report_prefs_dict.items():
-            if key == "include_tools" and isinstance(value, list):
-                allowed_tools = value
-            if isinstance(value, list):
-                value_str = ", ".join(map(str, value))
-            else:
-                value_str = str(value)
-            report_prefs += f"\n- {key}: {value_str}"
+def get_tool_responses(tool_calls, allowed_tool_mapping, on_event: Optional[EventCallback] = None,
+                       budget: Optional[TokenBudget] = None) -> list:
+    """Run the tool calls of one LLM turn concurrently, returning their messages in tool_call order."""
+    if len(tool_calls) == 1:
+        return [get_tool_response(tool_calls[0], allowed_tool_mapping, on_event, budget)]
+    return list(_tool_call_executor.map(
+        lambda tool_call: get_tool_response(tool_call, allowed_tool_mapping, on_event, budget),
+        tool_calls,
+    ))
 
-    # Filter tools based on allowed_tools
-    allowed_tool_defs = [tool.to_openai_tool() for tool in TOOLS if tool.name in allowed_tools]
-    allowed_tool_mapping = {tool.name: tool.invoke for tool in TOOLS if tool.name in allowed_tools}
 
-    # Build styling rules based on allowed tools
-    styling_rules = ["- Report must be written in full words suitable for text-to-speech."]
+# Seconds each tool's pre-fetch may take before the prompt is built without it.
+# A tool that misses its deadline keeps running and still warms its cache.
+PREFETCH_DEADLINES = {
+    "stadissa_tool": 25.0,
+    "local_events_tool": 12.0,
+}
+DEFAULT_PREFETCH_DEADLINE = 8.0
 
+_prefetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="report-prefetch")
 
-    if "get_unicafe" in allowed_tools:
-        styling_rules.append("- Be specific about the unicafe offerings if available.")
 
-    if "get_weather" in allowed_tools:
-        styling_rules.append("- The weather temperature must be shown as an integer (no decimals).")
-    
-    if "get_electricity_prices" in allowed_tools:
-        styling_rules.append("- Give summary of the most important electricity prices. Instead of 'c/kWh', write 'cents per kilowatt hour'.")
-    
-    if "yle_news" in allowed_tools:
-        styling_rules.append("- The news should be in markdown link format: [Short description](url), one per line.")
+def get_default_tool_queries(report_prefs_dict: dict) -> dict:
+    """Default arguments for each tool, used to pre-fetch data before the first LLM call."""
+    city = report_prefs_dict.get("city", "Helsinki")
+    return {
+        "get_weather": {"city": city},
+        "get_unicafe_menu": {"location": report_prefs_dict.get("campus", "Kumpula")},
+        "get_electricity_prices": {},
+        "yle_news": {"category": "latest"},
+        "get_dad_joke": {},
+        "stadissa_tool": {"category": "musiikki"},
+        "local_events_tool": {"city": city, "interests": report_prefs_dict.get("interests", "music,art,sports")},
+    }
 
-    if "local_events_tool" in allowed_tool_mapping:
-        styling_rules.append("- If there are local events, present them under clear category headings (e.g., 'Music Events'). For each event, list the name, venue, date, time, and price, with the event name linked to the event URL.")
-    
-    # Add tone instruction
-    tone_instruction = ""
-    if report_prefs_dict.get("tone"):
-        tone = report_prefs_dict["tone"]
-        styling_rules.append(f"Write the entire report in a {tone} tone. Maintain this tone consistently throughout.")
 
-    styling_rules_text = "\n".join(styling_rules) if len(styling_rules) > 1 else ""
+def prefetch_tool_calls(calls: dict, on_event: Optional[EventCallback] = None,
+                        events: Optional[dict] = None) -> dict:
+    """
+    Run tool calls given as {key: (tool_name, fn, args)} concurrently and
+    return the results that arrived within each tool's deadline, by key.
+    If events is given, the events of each call are stored in it by key as
+    (time.monotonic(), event_type, data), to be replayed into traces.
+    """
+    def call_on_event(key):
+        def handler(event_type, data):
+            events.setdefault(key, []).append((time.monotonic(), event_type, data))
+            _emit(on_event, event_type, **data)
+        return handler if events is not None else on_event
+
+    start = time.monotonic()
+    futures = {
+        key: (name, _prefetch_executor.submit(invoke_tool, name, fn, args, call_on_event(key)))
+        for key, (name, fn, args) in calls.items()
+    }
 
-    _messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a helpful assistant that generates daily reports. "
-                "Use only the tools you have access to. "
-                "Generate the concise final report as your last message."
-            )
-        },
-        {
-            "role": "user",
-            "content": (
-                f"It is {today_str}. Generate a concise report using only the available tools. "
-                "Do not mention or create sections for content you cannot retrieve. "
-                "Do not ask clarifying questions for missing inputs, use reasonable defaults. "
-                f"Content preferences: {report_prefs}"
-                "Do not format the report with any links, headings or bullet points."
-                "Translate any non-English content to English."
-                "Write everything in full sentences suitable for text-to-speech. Do not use abbreviations."
-                "You must present the information in the same order as the tools are listed in content preferences."
-                f"Report style rules: {styling_rules_text}" if styling_rules_text else ""
-            )
-        }
+    results = {}
+    for key, (name, future) in futures.items():
+        deadline = PREFETCH_DEADLINES.get(name, DEFAULT_PREFETCH_DEADLINE)
+        remaining = max(0.0, deadline - (time.monotonic() - start))
+        try:
+            results[key] = future.result(timeout=remaining)
+        except TimeoutError:
+            print(f"Pre-fetch of {key} missed its {deadline}s deadline, continuing without it")
+        except Exception as e:
+            print(f"Pre-fetch of {key} failed: {e}")
+    print(f"Pre-fetched {len(results)}/{len(futures)} tool calls in {time.monotonic() - start:.2f}s")
+    return results
+
+
+def prefetch_tool_data(tool_mapping: dict, queries: dict, on_event: Optional[EventCallback] = None) -> dict:
+    """
+    Run the default query of every tool concurrently and return the results
+    that arrived within each tool's deadline, keyed by tool name.
+    """
+    return prefetch_tool_calls(
+        {name: (name, tool_mapping[name], args) for name, args in queries.items() if name in tool_mapping},
+        on_event,
+    )
+
+
+# Report-writing rules that apply when a given tool's data is in the report.
+TOOL_STYLING_RULES = {
+    "get_unicafe_menu": "- Be specific about the unicafe offerings if available.",
+    "get_weather": "- The weather temperature must be shown as an integer (no decimals).",
+    "get_electricity_prices": "- Give summary of the most important electricity prices. Instead of 'c/kWh', write 'cents per kilowatt hour'.",
+    "yle_news": "- The news should be in markdown link format: [Short description](url), one per line.",
+    "local_events_tool": "- If there are local events, present them under clear category headings (e.g., 'Music Events'). For each event, list the name, venue, date, time, and price, with the event name linked to the event URL.",
+}
+
+# "conversation" lets the LLM write the whole report, calling tools as it goes.
+# "sections" writes one section per tool from the pre-fetched data and only
+# regenerates sections whose data changed.
+REPORT_MODE = os.getenv("REPORT_MODE", "conversation").lower()
+
+# Generated sections are cached like tool responses, keyed by a fingerprint of their inputs.
+SECTION_CACHE = "report_sections"
+configure_tool_cache(SECTION_CACHE, max_entries=128, policy=FixedTTL(datetime.timedelta(days=1)))
+
+# Personalization keys that only say when the edition is prepared (tasks/scheduler.py),
+# not what it says; they are kept out of the prompt.
+_SCHEDULING_PREFS = {"listening_time"}
+# Personalization keys that do not change how a single section is written.
+_SECTION_IRRELEVANT_PREFS = {"include_tools", "voice"} | _SCHEDULING_PREFS
+
+
+def generate_report_section(tool_name: str, tool_result: str, report_prefs_dict: dict, today_str: str,
+                            on_event: Optional[EventCallback] = None) -> str:
+    """Write the section of the report for one tool, reusing the cached section if its inputs are unchanged."""
+    prefs = {k: v for k, v in report_prefs_dict.items() if k not in _SECTION_IRRELEVANT_PREFS}
+    rules = [
+        "- Write in full sentences suitable for text-to-speech. Do not use abbreviations.",
+        "- Translate any non-English content to English.",
+        "- If the data is an error or contains nothing useful, reply with an empty message.",
     ]
+    if tool_name in TOOL_STYLING_RULES:
+        rules.append(TOOL_STYLING_RULES[tool_name])
+    if prefs.get("tone"):
+        rules.append(f"- Write in a {prefs['tone']} tone.")
+    rules_text = "\n".join(rules)
+
+    section_fingerprint = hashlib.sha256(json.dumps({
+        "tool": tool_name,
+        "data": canonical_tool_result(tool_result),
+        "prefs": prefs,
+        "rules": rules_text,
+        "date": today_str,
+    }, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    cached_section = get_cached_response(SECTION_CACHE, cache_key=section_fingerprint)
+    if cached_section is not None:
+        _emit(on_event, "section_reused", tool=tool_name)
+        return cached_section
+
+    def fetch():
+        _emit(on_event, "section_started", tool=tool_name)
+        start = time.monotonic()
+        msgs = [
+            {
+                "role": "system",
+                "content": (
+                    "You write one section of a concise daily report. "
+                    "Reply with the section text only, without a heading, greeting or sign-off."
+                )
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"It is {today_str}. Content preferences: {json.dumps(prefs, ensure_ascii=False)}\n"
+                    f"Style rules:\n{rules_text}\n\n"
+                    f"Write the section based on this data from the {tool_name} tool:\n"
+                    f"{compact_tool_result(tool_name, tool_result)}"
+                )
+            },
+        ]
+        response, endpoint = route_chat_completion(messages=msgs)
+        _emit(on_event, "section_finished", tool=tool_name,
+              duration_ms=round((time.monotonic() - start) * 1000),
+              provider=endpoint.provider, model=endpoint.model,
+              **(_usage_dict(response.usage) or {}))
+        return (response.choices[0].message.content or "").strip()
+
+    return get_or_fetch(SECTION_CACHE, fetch, cache_key=section_fingerprint)
+
+
+def generate_sectioned_report(allowed_tools, prefetched, report_prefs_dict, today_str,
+                              on_event: Optional[EventCallback] = None) -> str:
+    """
+    Write one section per tool in include_tools order, concurrently, and stitch
+    them together. Sections whose tool data is unchanged come from the cache.
+    """
+    tool_names = [name for name in allowed_tools if name in prefetched]
+
+    def write_section(tool_name):
+        try:
+            return generate_report_section(tool_name, prefetched[tool_name], report_prefs_dict, today_str, on_event)
+        except Exception as e:
+            print(f"Failed to write the {tool_name} section: {e}")
+            return ""
 
-    messages = _messages.copy()
-    # Fetch news items
-    if "yle_news" in allowed_tools:
-        news_tool = allowed_tool_mapping["yle_news"]
-        news_result_str = news_tool(_invoke=True, category="latest")
-        news_result = json.loads(news_result_str)
+    sections = list(_tool_call_executor.map(write_section, tool_names))
+    if tool_names and not any(sections):
+        raise RuntimeError("No report section could be generated")
+    return "\n\n".join(section for section in sections if section)
+
+
+def run_report_conversation(messages, prefetched, allowed_tool_defs, allowed_tool_mapping,
+                            on_event: Optional[EventCallback] = None, stream: bool = False) -> str:
+    """Generate the whole report in one multi-turn conversation where the LLM calls tools as needed."""
+    max_iterations = 10
+    iteration_count = 0
+    budget = TokenBudget()
+
+    # News items
+    if "yle_news" in prefetched:
+        news_result = json.loads(prefetched["yle_news"])
 
         news_links_for_llm = ""
         if "items" in news_result:
@@ -138,11 +346,9 @@ def generate_report() -> str:
 
         messages[1]["content"] += news_links_for_llm
 
-    # Fetch Stadissa events
-    if "stadissa_tool" in allowed_tools:
-        stadissa_tool = allowed_tool_mapping["stadissa_tool"]
-        stadissa_result_str = stadissa_tool(category="musiikki")
-        stadissa_result = json.loads(stadissa_result_str)
+    # Stadissa events
+    if "stadissa_tool" in prefetched:
+        stadissa_result = json.loads(prefetched["stadissa_tool"])
 
         stadissa_events_for_llm = ""
         if stadissa_result.get("status") == "success":
@@ -154,22 +360,13 @@ def generate_report() -> str:
                 for event in stadissa_result["events"][:5]:  # Limit to 5 events
                     stadissa_events_for_llm += f"- {event.get('title')} at {event.get('venue')} ({event.get('url')})\n"
         else:
-            stadissa_events_for_llm += f"\n\nNo events found from Stadissa.fi: {stadissa_result.get("message", "Unknown error")}"
+            stadissa_events_for_llm += f"\n\nNo events found from Stadissa.fi: {stadissa_result.get('message', 'Unknown error')}"
 
         messages[1]["content"] += stadissa_events_for_llm
 
-    if "local_events_tool" in allowed_tools:
-        # Assuming you have the city preference available, or default to Helsinki
-        city = report_prefs_dict.get("city", "Helsinki") 
-        interests = report_prefs_dict.get("interests", "music,art,sports")
-        
-        local_events_tool = allowed_tool_mapping["local_events_tool"]
-        
-        # Invoke the tool
-        local_events_result_str = local_events_tool(city=city, interests=interests) 
-        
+    if "local_events_tool" in prefetched:
         try:
-            local_events_result = json.loads(local_events_result_str)
+            local_events_result = json.loads(prefetched["local_events_tool"])
         except json.JSONDecodeError:
             local_events_result = {"status": "error", "summary": "Failed to parse JSON response from LocalEventsTool."}
         
@@ -198,34 +395,253 @@ def generate_report() -> str:
             
         messages[1]["content"] += local_events_for_llm
 
+    while iteration_count < max_iterations:
+        iteration_count += 1
+        _emit(on_event, "llm_iteration", iteration=iteration_count)
+        llm_start = time.monotonic()
+        message, usage = call_llm(messages, allowed_tool_defs, on_event, stream)
+        print(
+            f"Iteration {iteration_count}: {message.content}")
+        tool_calls = message.tool_calls or []
+        _emit(on_event, "llm_finished", iteration=iteration_count,
+              duration_ms=round((time.monotonic() - llm_start) * 1000),
+              tool_calls=[tool_call.function.name for tool_call in tool_calls],
+              **(usage or {}))
+        if not tool_calls:
+            break
+
+        tool_response_messages = get_tool_responses(tool_calls, allowed_tool_mapping, on_event, budget)
+        for tool_call, tool_response_message in zip(tool_calls, tool_response_messages):
+            messages.append(tool_response_message)
+            print(f"Tool {tool_call.function.name} response: {tool_response_message['content']}")
+
+    if iteration_count >= max_iterations:
+        print("Warning: Maximum iterations reached")
+
+    return messages[-1]["content"]
+
+
+PREFERENCES_PATH = os.path.join(os.path.dirname(__file__), "../report_personalization.json")
+
+
+def load_report_preferences() -> dict:
+    """Load the report personalization, or an empty dict if it is missing or unreadable."""
     try:
-        while iteration_count < max_iterations:
-            iteration_count += 1
-            resp = call_llm(messages, allowed_tool_defs)
-            print(
-                f"Iteration {iteration_count}: {resp.choices[0].message.content}")
-            tool_calls = resp.choices[0].message.tool_calls or []
-            if not tool_calls:
-                break
+        with open(PREFERENCES_PATH, "r") as pref_file:
+            return json.load(pref_file)
+    except Exception as e:
+        return {}
+
+
+def generate_report(on_event: Optional[EventCallback] = None, report_prefs_dict: Optional[dict] = None,
+                    prefetched: Optional[dict] = None, file_suffix: str = "", stream: Optional[bool] = None,
+                    prefetch_events: Optional[list] = None) -> str:
+    """
+    Generate a report from the saved personalization and save it under reports/.
+    report_prefs_dict overrides the saved personalization, and prefetched
+    supplies the tool data instead of pre-fetching it here (see generate_report_batch),
+    with prefetch_events, the (time.monotonic(), event_type, data) events of
+    that pre-fetch, replayed into this run's trace.
+    REPORT_MODE selects whether the LLM writes it in one tool-calling
+    conversation or section by section (see generate_sectioned_report).
+    If on_event is given, progress is reported through it and the LLM output is streamed
+    (unless stream=False): tool_started, tool_finished, llm_iteration, token and report_saved events.
+
+    If a report was generated from identical inputs (personalization, tools and
+    pre-fetched tool data) within REPORT_MEMO_WINDOW_MINUTES, it is returned
+    instead, with a report_reused event.
+
+    Every run that writes a report also saves a trace of its tool, LLM and
+    file-write spans under reports/traces/, and adds the report to reports/index.json.
+    """
+    # Only stream LLM output when someone is listening for it
+    if stream is None:
+        stream = on_event is not None
+    trace = RunTrace()
+    for at, event_type, data in prefetch_events or []:
+        trace.record(event_type, data, at=at)
+    on_event = trace.wrap(on_event)
+
+    # Correct current date
+    today = datetime.datetime.now()
+    today_str = today.strftime("%A, %B %d, %Y")
+
+    # Load report preferences
+    if report_prefs_dict is None:
+        report_prefs_dict = load_report_preferences()
+
+    report_prefs = ""
+    allowed_tools = []
+    if report_prefs_dict:
+        for key, value in report_prefs_dict.items():
+            if key == "include_tools" and isinstance(value, list):
+                allowed_tools = value
+            if key in _SCHEDULING_PREFS:
+                continue
+            if isinstance(value, list):
+                value_str = ", ".join(map(str, value))
+            else:
+                value_str = str(value)
+            report_prefs += f"\n- {key}: {value_str}"
+
+    # Filter tools based on allowed_tools
+    allowed_tool_defs = [tool.to_openai_tool() for tool in TOOLS if tool.name in allowed_tools]
+    allowed_tool_mapping = {tool.name: tool.invoke for tool in TOOLS if tool.name in allowed_tools}
+
+    # Build styling rules based on allowed tools
+    styling_rules = ["- Report must be written in full words suitable for text-to-speech."]
+    styling_rules += [TOOL_STYLING_RULES[name] for name in allowed_tools if name in TOOL_STYLING_RULES]
+
+    # Add tone instruction
+    if report_prefs_dict.get("tone"):
+        tone = report_prefs_dict["tone"]
+        styling_rules.append(f"Write the entire report in a {tone} tone. Maintain this tone consistently throughout.")
 
-            for tool_call in tool_calls:
-                tool_response_message = get_tool_response(tool_call, allowed_tool_mapping)
-                messages.append(tool_response_message)
-                print(f"Tool {tool_call.function.name} response: {tool_response_message['content']}")
+    styling_rules_text = "\n".join(styling_rules) if len(styling_rules) > 1 else ""
+
+    _messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a helpful assistant that generates daily reports. "
+                "Use only the tools you have access to. "
+                "Generate the concise final report as your last message."
+            )
+        },
+        {
+            "role": "user",
+            "content": (
+                f"It is {today_str}. Generate a concise report using only the available tools. "
+                "Do not mention or create sections for content you cannot retrieve. "
+                "Do not ask clarifying questions for missing inputs, use reasonable defaults. "
+                f"Content preferences: {report_prefs}"
+                "Do not format the report with any links, headings or bullet points."
+                "Translate any non-English content to English."
+                "Write everything in full sentences suitable for text-to-speech. Do not use abbreviations."
+                "You must present the information in the same order as the tools are listed in content preferences."
+                f"Report style rules: {styling_rules_text}" if styling_rules_text else ""
+            )
+        }
+    ]
 
-        if iteration_count >= max_iterations:
-            print("Warning: Maximum iterations reached")
+    messages = _messages.copy()
 
-        report_content = messages[-1]["content"]
+    # Pre-fetch every enabled tool's default query concurrently. Tools that are
+    # not injected into the prompt below still warm their caches for the LLM's
+    # own tool calls.
+    if prefetched is None:
+        prefetched = prefetch_tool_data(allowed_tool_mapping, get_default_tool_queries(report_prefs_dict), on_event)
+    else:
+        prefetched = {name: result for name, result in prefetched.items() if name in allowed_tool_mapping}
+
+    fingerprint = compute_report_fingerprint(report_prefs_dict, allowed_tools, prefetched, today_str)
+    memoized = find_memoized_report(fingerprint)
+    if memoized is not None:
+        memoized_file, memoized_content = memoized
+        print(f"Inputs unchanged since {memoized_file}, reusing it")
+        _emit(on_event, "report_reused", file=memoized_file)
+        return memoized_content
 
+    try:
+        if REPORT_MODE == "sections":
+            report_content = generate_sectioned_report(allowed_tools, prefetched, report_prefs_dict, today_str, on_event)
+        else:
+            report_content = run_report_conversation(messages, prefetched, allowed_tool_defs, allowed_tool_mapping,
+                                                     on_event, stream)
+        report_failed = False
     except Exception as e:
         report_content = f"Error generating report: {e}"
+        report_failed = True
 
     if not os.path.exists("reports"):
         os.makedirs("reports")
 
-    file_name = f"reports/report-{today.strftime('%Y-%m-%d_%H-%M-%S')}.txt"
+    file_name = f"reports/report-{today.strftime('%Y-%m-%d_%H-%M-%S')}{file_suffix}.txt"
+    write_start = time.monotonic()
     with open(file_name, "w") as f:
         f.write(report_content)
+    _emit(on_event, "report_saved", file=file_name, failed=report_failed,
+          duration_ms=round((time.monotonic() - write_start) * 1000))
+
+    if not report_failed:
+        record_report(fingerprint, file_name)
+
+    trace_file = None
+    try:
+        trace_file = trace.save(file_name)
+    except Exception as e:
+        print(f"Failed to save trace for {file_name}: {e}")
+
+    try:
+        add_report(file_name, created_at=today.astimezone(), trace=trace_file)
+    except Exception as e:
+        print(f"Failed to add {file_name} to the report index: {e}")
+
+    try:
+        maybe_apply_retention()
+    except Exception as e:
+        print(f"Report retention failed: {e}")
 
     return report_content
+
+
+# Profiles of a batch whose LLM conversations run at the same time.
+MAX_CONCURRENT_BATCH_REPORTS = int(os.getenv("REPORT_BATCH_CONCURRENCY", "3"))
+
+_batch_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCH_REPORTS, thread_name_prefix="report-batch")
+
+
+def _query_key(tool_name: str, args: dict) -> str:
+    return f"{tool_name}:{json.dumps(args, sort_keys=True, ensure_ascii=False)}"
+
+
+def generate_report_batch(profiles: list, on_event: Optional[EventCallback] = None) -> list:
+    """
+    Generate one report per personalization dict in profiles.
+
+    The default tool queries of all profiles are collected and each distinct
+    query is fetched once; profiles asking for the same city or campus share the
+    result. The per-profile reports are then written concurrently, at most
+    REPORT_BATCH_CONCURRENCY at a time, and saved as report-<time>_<n>.txt.
+    Events of a profile's run carry its index as "profile".
+    Returns the reports in profile order.
+    """
+    tool_mapping = {tool.name: tool.invoke for tool in TOOLS}
+
+    profile_queries = []
+    calls = {}
+    for prefs in profiles:
+        allowed_tools = prefs.get("include_tools") or []
+        queries = {
+            name: args for name, args in get_default_tool_queries(prefs).items()
+            if name in allowed_tools and name in tool_mapping
+        }
+        profile_queries.append(queries)
+        for name, args in queries.items():
+            calls.setdefault(_query_key(name, args), (name, tool_mapping[name], args))
+
+    # Each profile's trace gets the spans of the shared fetches it uses
+    fetch_events = {}
+    fetched = prefetch_tool_calls(calls, on_event, fetch_events)
+
+    def run_profile(index):
+        profile_on_event = None
+        if on_event is not None:
+            profile_on_event = lambda event_type, data: on_event(event_type, {**data, "profile": index})
+        prefetched = {
+            name: fetched[_query_key(name, args)]
+            for name, args in profile_queries[index].items()
+            if _query_key(name, args) in fetched
+        }
+        prefetch_events = [
+            event for name, args in profile_queries[index].items()
+            for event in fetch_events.get(_query_key(name, args), [])
+        ]
+        try:
+            return generate_report(profile_on_event, profiles[index], prefetched, file_suffix=f"_{index + 1}",
+                                   prefetch_events=prefetch_events)
+        except Exception as e:
+            print(f"Failed to generate the report of profile {index}: {e}")
+            return f"Error generating report: {e}"
+
+    return list(_batch_executor.map(run_profile, range(len(profiles))))
@@ -0,0 +1,256 @@
+import os
+import glob
+import json
+import threading
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from tasks.trace import trace_path
+from utils.files import file_lock, write_json_atomic
+
+REPORTS_DIR = "reports"
+AUDIO_DIR = os.path.join(REPORTS_DIR, "audio")
+TRANSCRIPTS_DIR = os.path.join(REPORTS_DIR, "transcripts")
+# Monthly zip archives of old reports, transcripts and traces (see tasks/retention.py).
+ARCHIVE_DIR = os.path.join(REPORTS_DIR, "archive")
+# Every generated report and the artefacts made from it, so lookups do not scan the directory.
+INDEX_PATH = os.path.join(REPORTS_DIR, "index.json")
+# Held around every read-modify-write of the index, so worker processes do not lose each other's updates.
+INDEX_LOCK_PATH = os.path.join(REPORTS_DIR, ".index.lock")
+
+_FILE_TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+_lock = threading.Lock()
+# The index as last read or written by this process, and the file's mtime at that point.
+_index: Optional[Dict[str, Any]] = None
+_index_mtime: Optional[tuple] = None
+
+
+@contextmanager
+def _locked():
+    """Exclude other threads of this process, then other processes, from the index."""
+    with _lock, file_lock(INDEX_LOCK_PATH):
+        yield
+
+
+def report_id(report_file: str) -> str:
+    """ID of a report, e.g. report-2025-01-01_08-00-00 for reports/report-2025-01-01_08-00-00.txt."""
+    return os.path.splitext(os.path.basename(report_file))[0]
+
+
+def audio_path(report_id: str) -> str:
+    return os.path.join(AUDIO_DIR, f"{report_id}.mp3")
+
+
+def transcript_path(report_id: str) -> str:
+    return os.path.join(TRANSCRIPTS_DIR, f"{report_id}.json")
+
+
+# An archived artefact's path is "<archive>#<member>", e.g. reports/archive/2025-01.zip#transcripts/report-....json
+ARCHIVE_SEPARATOR = "#"
+
+# Member name of each text artefact inside an archive.
+ARCHIVE_MEMBERS = {
+    "report": lambda rid: f"{rid}.txt",
+    "transcript": lambda rid: f"transcripts/{rid}.json",
+    "trace": lambda rid: f"traces/{rid}.json",
+}
+
+
+def is_archived(path: Optional[str]) -> bool:
+    return bool(path) and ARCHIVE_SEPARATOR in path
+
+
+def read_artefact(path: str, binary: bool = False):
+    """Read a report artefact, whether it is a plain file or a member of an archive."""
+    if is_archived(path):
+        archive, member = path.split(ARCHIVE_SEPARATOR, 1)
+        with zipfile.ZipFile(archive) as zf:
+            data = zf.read(member)
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    return data if binary else data.decode("utf-8")
+
+
+def _mtime() -> Optional[tuple]:
+    # Every write replaces the file, so the inode changes even within one mtime tick
+    try:
+        stat = os.stat(INDEX_PATH)
+        return stat.st_mtime_ns, stat.st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _created_at(rid: str, fallback_file: str) -> datetime:
+    """Creation time encoded in a report ID, or the mtime of fallback_file."""
+    stamp = rid[len("report-"):][:len("2025-01-01_08-00-00")]
+    try:
+        return datetime.strptime(stamp, _FILE_TIME_FORMAT).astimezone(timezone.utc)
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(fallback_file), timezone.utc)
+
+
+def _scan() -> Dict[str, Any]:
+    """Build the index from the files under reports/."""
+    records = []
+    for report_file in glob.glob(os.path.join(REPORTS_DIR, "report-*.txt")):
+        rid = report_id(report_file)
+        records.append({
+            "id": rid,
+            "created_at": _created_at(rid, report_file).isoformat(),
+            "report": report_file,
+            "audio": audio_path(rid) if os.path.exists(audio_path(rid)) else None,
+            "transcript": transcript_path(rid) if os.path.exists(transcript_path(rid)) else None,
+            "trace": trace_path(report_file) if os.path.exists(trace_path(report_file)) else None,
+        })
+    _add_archived(records)
+    records.sort(key=lambda record: record["created_at"])
+    return _new_index(records)
+
+
+def _add_archived(records: List[Dict[str, Any]]):
+    """Point records at archived artefacts, adding records for reports that only exist in an archive."""
+    by_id = {record["id"]: record for record in records}
+    for archive in sorted(glob.glob(os.path.join(ARCHIVE_DIR, "*.zip"))):
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                members = set(zf.namelist())
+        except zipfile.BadZipFile as e:
+            print(f"[report index] Skipping unreadable archive {archive}: {e}")
+            continue
+        for member in members:
+            rid = report_id(member)
+            for kind, member_name in ARCHIVE_MEMBERS.items():
+                if member_name(rid) != member:
+                    continue
+                record = by_id.get(rid)
+                if record is None:
+                    record = by_id[rid] = {
+                        "id": rid,
+                        "created_at": _created_at(rid, archive).isoformat(),
+                        "report": None,
+                        "audio": audio_path(rid) if os.path.exists(audio_path(rid)) else None,
+                        "transcript": None,
+                        "trace": None,
+                    }
+                    records.append(record)
+                if not record.get(kind):
+                    record[kind] = f"{archive}{ARCHIVE_SEPARATOR}{member}"
+
+
+
+def _new_index(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "latest": records[-1]["id"] if records else None,
+        "reports": {record["id"]: record for record in records},
+    }
+
+
+def _save(index: Dict[str, Any]):
+    global _index, _index_mtime
+    write_json_atomic(INDEX_PATH, index)
+    _index, _index_mtime = index, _mtime()
+
+
+def _load() -> Dict[str, Any]:
+    """
+    Return the index, re-reading the file only when another process has
+    rewritten it. A missing or unreadable index is rebuilt from the directory.
+    Must be called inside _locked().
+    """
+    global _index, _index_mtime
+    mtime = _mtime()
+    if _index is not None and mtime == _index_mtime:
+        return _index
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            _index, _index_mtime = json.load(f), mtime
+    except (FileNotFoundError, json.JSONDecodeError):
+        print(f"[report index] {INDEX_PATH} missing or unreadable, rebuilding it")
+        _save(_scan())
+    return _index
+
+
+def rebuild_index() -> int:
+    """Recreate the index from the files under reports/. Returns how many reports it holds."""
+    with _locked():
+        index = _scan()
+        _save(index)
+        return len(index["reports"])
+
+
+def add_report(report_file: str, created_at: Optional[datetime] = None, trace: Optional[str] = None) -> Dict[str, Any]:
+    """Record a newly written report and return its index record."""
+    created_at = created_at or datetime.now(timezone.utc)
+    rid = report_id(report_file)
+    record = {
+        "id": rid,
+        "created_at": created_at.astimezone(timezone.utc).isoformat(),
+        "report": report_file,
+        "audio": None,
+        "transcript": None,
+        "trace": trace,
+    }
+    with _locked():
+        index = _load()
+        reports = dict(index["reports"])
+        reports[rid] = record
+        latest = reports.get(index["latest"]) if index["latest"] else None
+        if latest is None or record["created_at"] >= latest["created_at"]:
+            latest = record
+        _save({"latest": latest["id"], "reports": reports})
+    return record
+
+
+def update_report(report_id: str, **paths: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Set artefact paths (report, audio, transcript, trace) of an indexed report."""
+    return update_reports({report_id: paths}).get(report_id)
+
+
+def update_reports(changes: Dict[str, Dict[str, Optional[str]]]) -> Dict[str, Dict[str, Any]]:
+    """Set artefact paths of several indexed reports in one index write. Unknown IDs are ignored."""
+    with _locked():
+        index = _load()
+        reports = dict(index["reports"])
+        updated = {}
+        for rid, paths in changes.items():
+            if rid in reports:
+                updated[rid] = reports[rid] = {**reports[rid], **paths}
+        if updated:
+            _save({**index, "reports": reports})
+    return updated
+
+
+def get_report(report_id: str) -> Optional[Dict[str, Any]]:
+    with _locked():
+        return _load()["reports"].get(report_id)
+
+
+def latest_report() -> Optional[Dict[str, Any]]:
+    """Record of the most recently created report, or None if there are none."""
+    with _locked():
+        index = _load()
+        return index["reports"].get(index["latest"]) if index["latest"] else None
+
+
+def list_reports(limit: Optional[int] = 20, offset: int = 0, having: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Index records newest first, optionally only those with a given artefact ("audio", "transcript" or "trace")."""
+    with _locked():
+        records = list(_load()["reports"].values())
+    records.sort(key=lambda record: record["created_at"], reverse=True)
+    if having:
+        records = [record for record in records if record.get(having)]
+    return records[offset:] if limit is None else records[offset:offset + limit]
+
+
+if __name__ == "__main__":
+    # python -m tasks.report_index rebuild
+    import sys
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python -m tasks.report_index rebuild")
+        sys.exit(2)
+    print(f"Indexed {rebuild_index()} reports into {INDEX_PATH}")
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from tasks.report_index import (
+    ARCHIVE_DIR, ARCHIVE_MEMBERS, ARCHIVE_SEPARATOR, is_archived, list_reports, update_reports,
+)
+from utils.files import file_lock
+
+
+def _limit(name: str, default: str) -> Optional[float]:
+    """Read a retention limit from the environment; 0 or empty means no limit."""
+    value = float(os.getenv(name, default) or 0)
+    return value or None
+
+
+# How long and how many of each artefact are kept as plain files. Older
+# reports, transcripts and traces are compressed into monthly archives under
+# reports/archive/; audio is deleted, since MP3s do not compress and can be
+# generated again from the report.
+RETENTION_LIMITS = {
+    "report": {
+        "max_age_days": _limit("RETENTION_REPORT_DAYS", "30"),
+        "max_count": _limit("RETENTION_REPORT_MAX_COUNT", "0"),
+    },
+    "transcript": {
+        "max_age_days": _limit("RETENTION_TRANSCRIPT_DAYS", "7"),
+        "max_count": _limit("RETENTION_TRANSCRIPT_MAX_COUNT", "50"),
+    },
+    "trace": {
+        "max_age_days": _limit("RETENTION_TRACE_DAYS", "14"),
+        "max_count": _limit("RETENTION_TRACE_MAX_COUNT", "0"),
+    },
+    "audio": {
+        "max_age_days": _limit("RETENTION_AUDIO_DAYS", "7"),
+        "max_count": _limit("RETENTION_AUDIO_MAX_COUNT", "50"),
+    },
+}
+# Minimum time between retention runs triggered by report generation.
+RETENTION_INTERVAL = timedelta(minutes=float(os.getenv("RETENTION_INTERVAL_MINUTES", "60")))
+
+# Held for a whole run, so two worker processes never append to the same archive at once.
+LOCK_PATH = os.path.join(ARCHIVE_DIR, ".retention.lock")
+
+_lock = threading.Lock()
+_last_run: Optional[float] = None
+
+
+def _is_expired(record: Dict[str, Any], position: int, limits: Dict[str, Optional[float]], now: datetime) -> bool:
+    """Whether the artefact of the position'th newest record is beyond its age or count limit."""
+    if limits["max_count"] is not None and position >= limits["max_count"]:
+        return True
+    if limits["max_age_days"] is not None:
+        age = now - datetime.fromisoformat(record["created_at"])
+        return age > timedelta(days=limits["max_age_days"])
+    return False
+
+
+def _archive(record: Dict[str, Any], kind: str) -> Tuple[str, int]:
+    """
+    Move one text artefact into the archive of the month it was created in.
+    Returns its archived path and the bytes reclaimed.
+    """
+    src = record[kind]
+    member = ARCHIVE_MEMBERS[kind](record["id"])
+    archive = os.path.join(ARCHIVE_DIR, f"{record['created_at'][:7]}.zip")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    size_before = os.path.getsize(archive) if os.path.exists(archive) else 0
+    with zipfile.ZipFile(archive, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+        # A run that stopped after archiving but before deleting leaves the member in place already
+        if member not in zf.namelist():
+            zf.write(src, member)
+    reclaimed = os.path.getsize(src) - (os.path.getsize(archive) - size_before)
+    os.remove(src)
+    return f"{archive}{ARCHIVE_SEPARATOR}{member}", reclaimed
+
+
+def apply_retention(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Archive or delete report artefacts beyond their RETENTION_LIMITS and point
+    the report index at the archived copies.
+    Returns per-artefact counts and the bytes reclaimed.
+    """
+    global _last_run
+    now = now or datetime.now(timezone.utc)
+    summary: Dict[str, Any] = {"bytes_reclaimed": 0}
+    changes: Dict[str, Dict[str, Optional[str]]] = {}
+
+    with _lock, file_lock(LOCK_PATH):
+        _last_run = time.monotonic()
+        for kind, limits in RETENTION_LIMITS.items():
+            stats = {"archived": 0, "deleted": 0, "bytes_reclaimed": 0}
+            records = [
+                record for record in list_reports(limit=None, having=kind)
+                if not is_archived(record[kind])
+            ]
+            for position, record in enumerate(records):
+                if not _is_expired(record, position, limits, now):
+                    continue
+                try:
+                    if kind == "audio":
+                        reclaimed = os.path.getsize(record[kind])
+                        os.remove(record[kind])
+                        new_path = None
+                        stats["deleted"] += 1
+                    else:
+                        new_path, reclaimed = _archive(record, kind)
+                        stats["archived"] += 1
+                except FileNotFoundError:
+                    # Removed by hand; just drop it from the index
+                    new_path, reclaimed = None, 0
+                except Exception as e:
+                    print(f"[retention] Failed to retire {record[kind]}: {e}")
+                    continue
+                changes.setdefault(record["id"], {})[kind] = new_path
+                stats["bytes_reclaimed"] += reclaimed
+            summary[kind] = stats
+            summary["bytes_reclaimed"] += stats["bytes_reclaimed"]
+
+        update_reports(changes)
+
+    print(f"[retention] Reclaimed {summary['bytes_reclaimed']} bytes: "
+          + ", ".join(f"{kind} {summary[kind]['archived']} archived/{summary[kind]['deleted']} deleted"
+                      for kind in RETENTION_LIMITS))
+    return summary
+
+
+def maybe_apply_retention() -> Optional[Dict[str, Any]]:
+    """Run apply_retention if RETENTION_INTERVAL has passed since the last run."""
+    if _last_run is not None and time.monotonic() - _last_run < RETENTION_INTERVAL.total_seconds():
+        return None
+    return apply_retention()
+
+
+if __name__ == "__main__":
+    # python -m tasks.retention
+    apply_retention()
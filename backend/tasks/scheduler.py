@@ -0,0 +1,176 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from zoneinfo import ZoneInfo
+
+from tasks.audio import DEFAULT_VOICE, render_report_audio, transcribe_report
+from tasks.report import generate_report, load_report_preferences
+from tasks.report_index import REPORTS_DIR, report_id
+
+# Each profile's report, audio and transcript are made this long before its listening time.
+LEAD_TIME = timedelta(minutes=float(os.getenv("SCHEDULER_LEAD_MINUTES", "15")))
+# Random delay of up to this many seconds added to each run, so profiles sharing a time do not all fire at once.
+JITTER_SECONDS = int(os.getenv("SCHEDULER_JITTER_SECONDS", "300"))
+# Listening time of profiles that do not set "listening_time".
+DEFAULT_LISTENING_TIME = os.getenv("SCHEDULER_DEFAULT_LISTENING_TIME", "07:30")
+TIMEZONE = ZoneInfo(os.getenv("SCHEDULER_TIMEZONE", "Europe/Helsinki"))
+# Optional list of extra personalization profiles, each with its own listening time.
+PROFILES_PATH = os.path.join(os.path.dirname(__file__), "../report_profiles.json")
+# Held by the one process that runs the scheduler.
+LOCK_PATH = os.path.join(REPORTS_DIR, ".scheduler.lock")
+# How often the scheduler re-reads the profiles, to pick up changes saved through other workers.
+PROFILE_REFRESH_MINUTES = 5
+
+_scheduler = None
+_lock_file = None
+# Hash of the profiles the current jobs were created from.
+_scheduled_profiles = None
+_lock = threading.Lock()
+
+
+def load_profiles() -> List[dict]:
+    """The saved personalization followed by the profiles in report_profiles.json, if any."""
+    profiles = []
+    prefs = load_report_preferences()
+    if prefs:
+        profiles.append(prefs)
+    try:
+        with open(PROFILES_PATH, "r") as f:
+            profiles += [profile for profile in json.load(f) if isinstance(profile, dict)]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[scheduler] Ignoring unreadable {PROFILES_PATH}: {e}")
+    return profiles
+
+
+def _run_time(profile: dict) -> Tuple[int, int]:
+    """Hour and minute at which to start a profile's edition: its listening time minus LEAD_TIME."""
+    listening_time = datetime.strptime(profile.get("listening_time") or DEFAULT_LISTENING_TIME, "%H:%M")
+    run_at = listening_time - LEAD_TIME
+    return run_at.hour, run_at.minute
+
+
+def run_edition(profile: dict, file_suffix: str = ""):
+    """
+    Prepare one profile's daily edition ahead of time: generate the report,
+    which pre-fetches and so warms the tool caches, then render its audio and
+    transcript, so that /latest-report and /tts/report only read files.
+    """
+    started = datetime.now(TIMEZONE)
+    saved = []
+
+    def on_event(event_type, data):
+        if event_type in ("report_saved", "report_reused"):
+            saved.append(data)
+
+    generate_report(on_event, profile, file_suffix=file_suffix, stream=False)
+    if not saved or saved[-1].get("failed"):
+        print("[scheduler] Report generation failed, not rendering audio")
+        return
+    report_file = saved[-1]["file"]
+    rid = report_id(report_file)
+
+    render_report_audio(rid, report_file, voice=profile.get("voice") or DEFAULT_VOICE)
+    transcribe_report(rid)
+    print(f"[scheduler] Edition {rid} ready in {(datetime.now(TIMEZONE) - started).total_seconds():.0f}s")
+
+
+def _acquire_lock() -> bool:
+    """Take the scheduler lock file without blocking. Only one worker process gets it."""
+    global _lock_file
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    # Opened without truncating, so a worker that fails to get the lock leaves the holder's PID in place
+    lock_file = open(LOCK_PATH, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _lock_file = lock_file
+    return True
+
+
+def schedule_profiles():
+    """
+    (Re)create one daily job per profile if the profiles changed since the jobs
+    were created. Call after the personalization changes. Profiles with an
+    unreadable listening_time are skipped.
+    """
+    global _scheduled_profiles
+    if _scheduler is None:
+        return
+    from apscheduler.triggers.cron import CronTrigger
+
+    with _lock:
+        profiles = load_profiles()
+        profiles_hash = hashlib.sha256(json.dumps(profiles, sort_keys=True).encode("utf-8")).hexdigest()
+        if profiles_hash == _scheduled_profiles:
+            return
+
+        # Work out every run time before touching the current jobs
+        run_times = {}
+        for index, profile in enumerate(profiles):
+            try:
+                run_times[index] = _run_time(profile)
+            except (TypeError, ValueError) as e:
+                print(f"[scheduler] Skipping profile {index + 1}, listening_time "
+                      f"{profile.get('listening_time')!r} is not HH:MM: {e}")
+
+        for job in _scheduler.get_jobs():
+            if job.id.startswith("edition:"):
+                job.remove()
+        for index, (hour, minute) in run_times.items():
+            profile = profiles[index]
+            key = hashlib.sha256(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+            _scheduler.add_job(
+                run_edition,
+                CronTrigger(hour=hour, minute=minute, timezone=TIMEZONE, jitter=JITTER_SECONDS),
+                args=[profile],
+                kwargs={"file_suffix": f"_{index + 1}" if len(profiles) > 1 else ""},
+                id=f"edition:{key}",
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1,
+                misfire_grace_time=int(LEAD_TIME.total_seconds()),
+            )
+            print(f"[scheduler] Profile {index + 1} scheduled daily at {hour:02d}:{minute:02d} (+ up to {JITTER_SECONDS}s)")
+        _scheduled_profiles = profiles_hash
+
+
+def start_scheduler() -> bool:
+    """
+    Start the edition scheduler in this process if no other worker runs it.
+    Returns whether this process runs it.
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return True
+    if not _acquire_lock():
+        print("[scheduler] Another worker runs the scheduler")
+        return False
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    _scheduler = BackgroundScheduler(timezone=TIMEZONE)
+    _scheduler.start()
+    schedule_profiles()
+    _scheduler.add_job(schedule_profiles, "interval", minutes=PROFILE_REFRESH_MINUTES, id="refresh-profiles")
+    return True
+
+
+def stop_scheduler():
+    global _scheduler, _lock_file, _scheduled_profiles
+    _scheduled_profiles = None
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=False)
+        _scheduler = None
+    if _lock_file is not None:
+        _lock_file.close()
+        _lock_file = None
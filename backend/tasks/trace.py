@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.files import write_json_atomic
+
+TRACES_DIR = os.path.join("reports", "traces")
+
+# Optional prices in USD per million tokens, used to estimate the cost of a run.
+_PROMPT_PRICE = os.getenv("LLM_PRICE_PER_MTOK_PROMPT")
+_COMPLETION_PRICE = os.getenv("LLM_PRICE_PER_MTOK_COMPLETION")
+
+# Events that close a span, and the kind of span they describe.
+_SPAN_EVENTS = {
+    "tool_finished": "tool",
+    "llm_finished": "llm",
+    "section_finished": "llm",
+    "report_saved": "file",
+}
+
+
+def trace_path(report_file: str) -> str:
+    """Path of the trace saved for reports/report-*.txt."""
+    report_name = os.path.splitext(os.path.basename(report_file))[0]
+    return os.path.join(TRACES_DIR, f"{report_name}.json")
+
+
+class RunTrace:
+    """
+    Structured timing and token record of one report run. It is fed the same
+    progress events generate_report emits, and turns every *_finished event
+    into a span starting duration_ms before it arrived.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, event_type: str, data: dict, at: Optional[float] = None):
+        """
+        Record the span an event closes. `at` is the time.monotonic() the event
+        arrived, for events replayed from before the run, such as a pre-fetch
+        shared by a batch; their spans start at a negative start_ms.
+        """
+        kind = _SPAN_EVENTS.get(event_type)
+        if kind is None:
+            return
+        duration_ms = data.get("duration_ms", 0)
+        end_ms = round(((at if at is not None else time.monotonic()) - self._start) * 1000)
+        span = {
+            "kind": kind,
+            "name": data.get("tool") or data.get("file") or f"iteration {data.get('iteration')}",
+            "start_ms": end_ms - duration_ms if at is not None else max(0, end_ms - duration_ms),
+            "duration_ms": duration_ms,
+        }
+        span.update({k: v for k, v in data.items() if k not in ("tool", "file", "duration_ms")})
+        with self._lock:
+            self.spans.append(span)
+
+    def wrap(self, on_event: Optional[Callable[[str, dict], None]]) -> Callable[[str, dict], None]:
+        """Return an event callback that records into this trace and then forwards to on_event."""
+        def handler(event_type: str, data: dict):
+            self.record(event_type, data)
+            if on_event is not None:
+                on_event(event_type, data)
+        return handler
+
+    def to_dict(self, report_file: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        llm_spans = [span for span in spans if span["kind"] == "llm"]
+        prompt_tokens = sum(span.get("prompt_tokens") or 0 for span in llm_spans)
+        completion_tokens = sum(span.get("completion_tokens") or 0 for span in llm_spans)
+        totals = {
+            "duration_ms": round((time.monotonic() - self._start) * 1000),
+            "llm_ms": sum(span["duration_ms"] for span in llm_spans),
+            "tool_ms": sum(span["duration_ms"] for span in spans if span["kind"] == "tool"),
+            "llm_calls": len(llm_spans),
+            "tool_calls": sum(1 for span in spans if span["kind"] == "tool"),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+        # The router may answer each call from a different endpoint; the run is
+        # labelled with the one that answered most of them.
+        endpoints = Counter((span.get("provider"), span.get("model")) for span in llm_spans)
+        provider, model = endpoints.most_common(1)[0][0] if endpoints else (None, None)
+        if _PROMPT_PRICE and _COMPLETION_PRICE:
+            totals["cost_usd"] = round(
+                (prompt_tokens * float(_PROMPT_PRICE) + completion_tokens * float(_COMPLETION_PRICE)) / 1_000_000, 6)
+        return {
+            "report": report_file,
+            "started_at": self.started_at.isoformat(),
+            "model": model,
+            "provider": provider,
+            "totals": totals,
+            "spans": spans,
+        }
+
+    def save(self, report_file: str) -> str:
+        """Save the trace next to its report and return the trace's path."""
+        path = trace_path(report_file)
+        write_json_atomic(path, self.to_dict(report_file))
+        return path
@@ -1,7 +1,7 @@
 import json
 import requests
 from tools.Tool import Tool
-from utils.cache import get_cached_response, set_cached_response
+from utils.cache import get_or_fetch
 
 class DadJokeTool(Tool):
     name = "get_dad_joke"
@@ -11,20 +11,18 @@ class DadJokeTool(Tool):
                          "required": [] }
 
     def _invoke(self, **kwargs):
-        cached_data = get_cached_response(self.name)
-        if cached_data:
-            return json.dumps(cached_data, ensure_ascii=False, indent=2)
-
         url = "https://icanhazdadjoke.com/"
         headers = {"Accept": "application/json"}
 
-        try:
+        def fetch():
             resp = requests.get(url, headers=headers, timeout=5)
             resp.raise_for_status()
             data = resp.json()
-            result = {"joke": data.get("joke", "Couldn't fetch a dad joke.")}
+            return {"joke": data.get("joke", "Couldn't fetch a dad joke.")}
+
+        try:
+            result = get_or_fetch(self.name, fetch, upstream=url)
         except requests.exceptions.RequestException as e:
             result = {"error": f"Error fetching dad joke: {e}"}
 
-        set_cached_response(self.name, result)
         return json.dumps(result, ensure_ascii=False, indent=2)
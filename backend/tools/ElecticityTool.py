@@ -3,7 +3,7 @@ import json
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from tools.Tool import Tool
-from utils.cache import get_cached_response, set_cached_response
+from utils.cache import get_or_fetch, UntilNextPublication
 
 TIMEZONE = ZoneInfo("Europe/Helsinki")
 
@@ -13,22 +13,25 @@ class ElectricityTool(Tool):
     parameter_schema = { "type": "object",
                          "properties": {},
                          "required": [] }
+    # Day-ahead spot prices for tomorrow are published once a day in the afternoon
+    cache_policy = UntilNextPublication(["14:15"], TIMEZONE)
+    cache_serve_stale_on_error = True
 
     def _invoke(self, **kwargs):
-        cached_data = get_cached_response(self.name)
-        if cached_data:
-            return json.dumps(cached_data, ensure_ascii=False, indent=2)
-
         url = "https://api.porssisahko.net/v1/latest-prices.json"
 
-        try:
+        def fetch():
             resp = requests.get(url, timeout=10)
             resp.raise_for_status()
-            data = resp.json()
+            return resp.json().get("prices", [])
+
+        # The raw price list is cached and filtered on every call, so hours
+        # that have already passed drop out even while the entry is fresh.
+        try:
+            prices = get_or_fetch(self.name, fetch, upstream=url)
         except requests.exceptions.RequestException as e:
             return json.dumps({"error": f"Failed to fetch data: {e}"})
 
-        prices = data.get("prices", [])
         if not prices:
             return json.dumps({"error": "No price data returned from API"})
 
@@ -53,6 +56,4 @@ class ElectricityTool(Tool):
             "upcoming_hours": upcoming_prices
         }
 
-        set_cached_response(self.name, result)
-
         return json.dumps(result)
@@ -3,8 +3,9 @@ import json
 import requests
 from dataclasses import dataclass
 from typing import Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta
 from tools.Tool import Tool
+from utils.cache import get_or_fetch, FixedTTL
 
 @dataclass
 class LocalEventsTool(Tool):
@@ -14,6 +15,9 @@ class LocalEventsTool(Tool):
     description: str = "Finds local events based on a city and optional interests. Uses personalization for defaults. ALWAYS returns a list of events in the 'events' field."
     parameter_schema: Dict[str, Any] = None
     api_key: str =  os.getenv("TICKETMASTER_API_KEY")
+    cache_policy = FixedTTL(timedelta(hours=1))
+    cache_serve_stale_on_error = True
+
     def __post_init__(self) -> None:
         self.parameter_schema = {
             "type": "object",
@@ -94,10 +98,13 @@ class LocalEventsTool(Tool):
                 if segment_ids:
                     params["segmentId"] = ",".join(segment_ids)
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            def fetch():
+                response = requests.get(url, params=params, timeout=10)
+                response.raise_for_status()
+                return response.json()
+
+            cache_key = f"{city.lower()}|{params.get('segmentId', '')}|{max_events}"
+            data = get_or_fetch(self.name, fetch, cache_key=cache_key, upstream=url)
             
             # Get total elements from API
             total_elements = data.get('page', {}).get('totalElements', 0)
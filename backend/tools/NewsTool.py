@@ -5,7 +5,7 @@ from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional
 from xml.etree import ElementTree as ET
 from tools.Tool import Tool
-from utils.cache import get_cached_response, set_cached_response
+from utils.cache import get_or_fetch, FixedTTL
 
 import requests
 from bs4 import BeautifulSoup
@@ -142,6 +142,9 @@ class NewsTool(Tool):
         "news article if a URL is provided."
     )
     parameter_schema: Dict[str, Any] = None
+    cache_policy = FixedTTL(timedelta(minutes=5))
+    cache_max_stale = timedelta(minutes=30)
+    cache_serve_stale_on_error = True
 
     def __post_init__(self) -> None:
         self.parameter_schema = {
@@ -170,21 +173,19 @@ class NewsTool(Tool):
         category = kwargs.get("category", "latest")
         rss_url = RSS_FEEDS.get(category, RSS_FEEDS["latest"])
 
-        cached_data = get_cached_response(self.name, cache_key=category)
-        if cached_data:
-            return json.dumps(cached_data, ensure_ascii=False, indent=2)
-
-        """Fetch the RSS feed and return structured JSON text."""
-        try:
+        def fetch():
+            """Fetch the RSS feed and return structured output."""
             xml_text = _http_get(rss_url, timeout=10.0)
             parsed = _parse_rss(xml_text, rss_url)
-            output = {
+            return {
                 "source": parsed["source"],
                 "fetched_at": datetime.now(timezone.utc).isoformat(),
                 "count": len(parsed["items"]),
                 "items": parsed["items"],
             }
-            set_cached_response(self.name, output, cache_key=category)
+
+        try:
+            output = get_or_fetch(self.name, fetch, cache_key=category, upstream=rss_url)
             return json.dumps(output, ensure_ascii=False, indent=2)
         except Exception as e:
             result = {
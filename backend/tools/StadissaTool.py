@@ -1,4 +1,4 @@
-from utils.llm import get_client_and_model, chat_with_rate_limit
+from utils.router import route_chat_completion
 import json
 import time
 from datetime import datetime, timedelta
@@ -8,9 +8,7 @@ from urllib.parse import urljoin, urlparse
 import logging
 from tools.Tool import Tool
 import asyncio
-from bs4 import BeautifulSoup
-from services.crawl4ai_service import Crawl4AIService
-from utils.cache import get_cached_response, set_cached_response
+from utils.cache import get_or_fetch, FixedTTL
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -18,6 +16,8 @@ logger = logging.getLogger(__name__)
 
 def extract_event_data(html_content: str, base_url: str) -> List[Dict]:
     """Extract event information from the HTML content."""
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
     events = []
 
@@ -42,12 +42,17 @@ def extract_event_data(html_content: str, base_url: str) -> List[Dict]:
     return events
 
 
+STADISSA_URL = "https://www.stadissa.fi"
+
+
 class StadissaAPI:
     """Simple API wrapper for easy integration with AI agents"""
 
     def __init__(self):
+        from services.crawl4ai_service import Crawl4AIService
+
         self.crawl4ai_service = Crawl4AIService()
-        self.base_url = "https://www.stadissa.fi"
+        self.base_url = STADISSA_URL
 
     async def get_events(self, category: str = None) -> List[Dict]:
         url = self.base_url
@@ -61,29 +66,25 @@ class StadissaAPI:
             url += "?" + "&".join(params)
 
         logger.info(f"Crawl4AIService fetching URL: {url}")
-        try:
-            headers = {"Cookie": "qc_cmp_consent=1;"}  # Generic consent cookie
-            crawl_result = await self.crawl4ai_service.crawl(url, headers=headers)
+        headers = {"Cookie": "qc_cmp_consent=1;"}  # Generic consent cookie
+        crawl_result = await self.crawl4ai_service.crawl(url, headers=headers)
 
-            if crawl_result and "html" in crawl_result:
-                return extract_event_data(crawl_result["html"], self.base_url)
-            else:
-                logger.error(
-                    f"Crawl4AIService failed to fetch content for {url}")
-                return []
-        except Exception as e:
+        # Raise rather than return no events, so a failed crawl is not cached as an empty result
+        if not crawl_result or "html" not in crawl_result:
             logger.error(
-                f"Error fetching page with Crawl4AIService for {url}: {e}")
-            return []
+                f"Crawl4AIService failed to fetch content for {url}")
+            raise ConnectionError(f"Crawl4AIService failed to fetch content for {url}")
+        return extract_event_data(crawl_result["html"], self.base_url)
 
 
 class StadissaTool(Tool):
     name: str = "stadissa_tool"
     description: str = "A tool to fetch events from Stadissa.fi based on category and city filters and summarize them."
+    cache_policy = FixedTTL(timedelta(hours=1))
 
     def __init__(self):
         super().__init__()
-        self.api = StadissaAPI()
+        self._api: Optional[StadissaAPI] = None
         self.available_categories = [
             "musiikki", "urheilu", "teatteri & taide", "muut menot"]
         self.available_cities = []
@@ -100,6 +101,13 @@ class StadissaTool(Tool):
             "required": []
         }
 
+    @property
+    def api(self) -> StadissaAPI:
+        """The crawler client, created on first use so importing the tools stays cheap."""
+        if self._api is None:
+            self._api = StadissaAPI()
+        return self._api
+
     def _invoke(self, category: Optional[str] = None) -> str:
         """
         Tool function for AI agents to get Stadissa events and summarize them.
@@ -116,57 +124,50 @@ class StadissaTool(Tool):
         if category: cache_key_parts.append(f"category_{category}")
         cache_key = "_".join(cache_key_parts) if cache_key_parts else "all_events"
 
-        cached_result = get_cached_response(self.name, cache_key=cache_key)
-        if cached_result:
-            logger.info(f"Cache hit for StadissaTool with key: {cache_key}")
-            return json.dumps(cached_result, ensure_ascii=False, indent=2)
-
-        try:
+        def fetch():
             events = asyncio.run(self.api.get_events(
                 category=category))
             print("Fetched events:", events)
-            if events:
-                # Limit to 10 events for LLM processing
-                events_for_llm_processing = events[:10]
-
-                # Format events for LLM
-                event_strings = []
-                for event in events_for_llm_processing:
-                    event_strings.append(
-                        f"- {event.get('title')} at {event.get('venue')} ({event.get('url')})")
-                events_for_llm = "\n".join(event_strings)
-
-                # Get LLM client and model
-                client, model = get_client_and_model()
-
-                # Create prompt for LLM
-                prompt = f"Summarize the following events from Stadissa.fi. Focus on key details like event name, venue, and provide a brief overview. If there are many events, group similar ones or highlight the most prominent ones. Events:\n{events_for_llm}"
-                messages = [
-                    {"role": "system",
-                        "content": "You are a helpful assistant that summarizes events."},
-                    {"role": "user", "content": prompt}
-                ]
-
-                # Get summary from LLM
-                response = chat_with_rate_limit(client, model, messages)
-                print("LLM Response:", response)
-                summary = response.choices[0].message.content
-
-                result = {
-                    "status": "success",
-                    "summary": summary,
-                    "count": len(events),
-                    "filters": {"category": category},
-                    "events": events # Include all fetched events in the result
-                }
-            else:
-                result = {
+            if not events:
+                return {
                     "status": "no_events",
                     "message": "No events found matching your request",
                     "filters": {"category": category}
                 }
 
-            set_cached_response(self.name, result, cache_key=cache_key)
+            # Limit to 10 events for LLM processing
+            events_for_llm_processing = events[:10]
+
+            # Format events for LLM
+            event_strings = []
+            for event in events_for_llm_processing:
+                event_strings.append(
+                    f"- {event.get('title')} at {event.get('venue')} ({event.get('url')})")
+            events_for_llm = "\n".join(event_strings)
+
+            # Create prompt for LLM
+            prompt = f"Summarize the following events from Stadissa.fi. Focus on key details like event name, venue, and provide a brief overview. If there are many events, group similar ones or highlight the most prominent ones. Events:\n{events_for_llm}"
+            messages = [
+                {"role": "system",
+                    "content": "You are a helpful assistant that summarizes events."},
+                {"role": "user", "content": prompt}
+            ]
+
+            # Get summary from LLM
+            response, _ = route_chat_completion(messages=messages)
+            print("LLM Response:", response)
+            summary = response.choices[0].message.content
+
+            return {
+                "status": "success",
+                "summary": summary,
+                "count": len(events),
+                "filters": {"category": category},
+                "events": events # Include all fetched events in the result
+            }
+
+        try:
+            result = get_or_fetch(self.name, fetch, cache_key=cache_key, upstream=STADISSA_URL)
             return json.dumps(result, ensure_ascii=False, indent=2)
 
         except Exception as e:
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from typing import Dict, Any, Optional
+from datetime import timedelta
+from utils.cache import CachePolicy, DEFAULT_CACHE_POLICY
 
 class Tool(ABC):
     """Abstract base class for tools that can be invoked and converted to OpenAI tool definitions."""
@@ -8,6 +10,15 @@ class Tool(ABC):
     name: str
     description: str
     parameter_schema: Dict[str, Any]
+    # How many cache keys of this tool are kept in the in-memory cache tier.
+    cache_max_entries: int = 64
+    # When entries written by this tool stop being fresh.
+    cache_policy: CachePolicy = DEFAULT_CACHE_POLICY
+    # How long past expiry a cached value may still be served while it is
+    # refreshed in the background. None always refetches synchronously.
+    cache_max_stale: Optional[timedelta] = None
+    # Serve the last good cached value, however old, while the upstream is failing.
+    cache_serve_stale_on_error: bool = False
 
     def invoke(self, **kwargs) -> str:
         """Invoke the tool with the given keyword arguments."""
@@ -4,7 +4,8 @@ import requests
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta, timezone
 from tools.Tool import Tool
-from utils.cache import get_cached_response, set_cached_response
+from zoneinfo import ZoneInfo
+from utils.cache import get_or_fetch, UntilLocalMidnight
 
 class UnicafeTool(Tool):
     name: str = "get_unicafe_menu"
@@ -19,6 +20,9 @@ class UnicafeTool(Tool):
         },
         "required": ["location"]
     }
+    # Menus only change from one day to the next
+    cache_policy = UntilLocalMidnight(ZoneInfo("Europe/Helsinki"))
+    cache_serve_stale_on_error = True
 
     location_names = [
         "Keskusta",
@@ -31,19 +35,18 @@ class UnicafeTool(Tool):
         location = kwargs.get("location")
         base_url = "https://unicafe.fi/wp-json/swiss/v1/restaurants/?lang=en"
 
-        all_restaurants_data = get_cached_response(self.name)
+        def fetch():
+            response = requests.get(base_url, timeout=10)
+            response.raise_for_status()
+            print("Fetched new unicafe menu data")
+            return response.json()
 
-        if not all_restaurants_data:
-            try:
-                response = requests.get(base_url)
-                response.raise_for_status()
-                all_restaurants_data = response.json()
-                set_cached_response(self.name, all_restaurants_data)
-                print("Fetched new unicafe menu data")
-            except requests.exceptions.RequestException as e:
-                err_msg = f"Error fetching unicafe menu data: {e}"
-                print(err_msg)
-                return err_msg
+        try:
+            all_restaurants_data = get_or_fetch(self.name, fetch, upstream=base_url)
+        except requests.exceptions.RequestException as e:
+            err_msg = f"Error fetching unicafe menu data: {e}"
+            print(err_msg)
+            return err_msg
 
         # Filter restaurants by location
         restaurants = []
@@ -4,7 +4,8 @@ import requests
 import os
 
 from tools.Tool import Tool
-from utils.cache import get_cached_response, set_cached_response
+from datetime import timedelta
+from utils.cache import get_or_fetch, FixedTTL
 
 class WeatherTool(Tool):
     name = "get_weather"
@@ -19,14 +20,13 @@ class WeatherTool(Tool):
         },
         "required": ["city"]
     }
+    cache_policy = FixedTTL(timedelta(minutes=10))
+    cache_max_stale = timedelta(minutes=30)
+    cache_serve_stale_on_error = True
 
     def _invoke(self, **kwargs):
         city = kwargs.get("city")
 
-        cached_data = get_cached_response(self.name, cache_key=city)
-        if cached_data:
-            return json.dumps(cached_data, ensure_ascii=False, indent=2)
-
         base_url = "http://api.openweathermap.org/data/2.5/weather"
         params = {
             'q': city,
@@ -34,11 +34,13 @@ class WeatherTool(Tool):
             'units': 'metric'
         }
 
-        try:
-            response = requests.get(base_url, params=params)
+        def fetch():
+            response = requests.get(base_url, params=params, timeout=10)
             response.raise_for_status()
-            weather_data = response.json()
-            set_cached_response(self.name, weather_data, cache_key=city)
+            return response.json()
+
+        try:
+            weather_data = get_or_fetch(self.name, fetch, cache_key=city, upstream=base_url)
             return json.dumps(weather_data)
         except requests.exceptions.RequestException as e:
             err_msg = f"Error fetching weather data: {e}"
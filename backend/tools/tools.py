@@ -6,6 +6,7 @@ from tools.DadJokeTool import DadJokeTool
 from tools.StadissaTool import StadissaTool 
 from tools.Tool import Tool
 from tools.LocalEventsTool import LocalEventsTool
+from utils.cache import configure_tool_cache
 
 TOOLS: list[Tool] = [
     WeatherTool(),
@@ -17,6 +18,15 @@ TOOLS: list[Tool] = [
     LocalEventsTool()
 ]
 
+for tool in TOOLS:
+    configure_tool_cache(
+        tool.name,
+        max_entries=tool.cache_max_entries,
+        policy=tool.cache_policy,
+        max_stale=tool.cache_max_stale,
+        serve_stale_on_error=tool.cache_serve_stale_on_error,
+    )
+
 TOOL_MAPPING = {tool.name: tool.invoke for tool in TOOLS}
 
 TOOL_DEFS = [tool.to_openai_tool() for tool in TOOLS]
@@ -1,55 +1,461 @@
 import os
-import json
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from utils.cache_store import CacheStore, create_store
 
 _CACHE_DIR = "cache"
 _DEFAULT_CACHE_DURATION = timedelta(minutes=1)
 
-def _get_cache_file_path(tool_name: str) -> str:
-    return os.path.join(_CACHE_DIR, f"{tool_name}_cache.json")
+# Key under which responses stored without a cache_key are kept.
+_UNKEYED = ""
+
+
+# -------------------------
+# Expiry policies
+# -------------------------
+
+class CachePolicy(ABC):
+    """Decides when an entry written at a given moment stops being fresh."""
+
+    @abstractmethod
+    def expires_at(self, now: datetime) -> datetime:
+        pass
+
+
+class FixedTTL(CachePolicy):
+    """Entries stay fresh for a fixed duration after they are written."""
+
+    def __init__(self, duration: timedelta):
+        self.duration = duration
+
+    def expires_at(self, now: datetime) -> datetime:
+        return now + self.duration
+
+
+class UntilLocalMidnight(CachePolicy):
+    """Entries stay fresh until the next midnight in the given timezone."""
+
+    def __init__(self, tz: tzinfo):
+        self.tz = tz
+
+    def expires_at(self, now: datetime) -> datetime:
+        local_now = now.astimezone(self.tz)
+        next_day = local_now.date() + timedelta(days=1)
+        midnight = datetime.combine(next_day, time(0, 0), tzinfo=self.tz)
+        return midnight.astimezone(timezone.utc)
+
+
+class UntilNextPublication(CachePolicy):
+    """
+    Entries stay fresh until the next known publication time of the upstream,
+    e.g. day-ahead electricity prices published every afternoon.
+    publish_times are local "HH:MM" strings in the given timezone.
+    """
+
+    def __init__(self, publish_times: List[str], tz: tzinfo):
+        self.publish_times = sorted(time.fromisoformat(t) for t in publish_times)
+        self.tz = tz
+
+    def expires_at(self, now: datetime) -> datetime:
+        local_now = now.astimezone(self.tz)
+        for day_offset in (0, 1):
+            day = local_now.date() + timedelta(days=day_offset)
+            for publish_time in self.publish_times:
+                candidate = datetime.combine(day, publish_time, tzinfo=self.tz)
+                if candidate > local_now:
+                    return candidate.astimezone(timezone.utc)
+        return now + _DEFAULT_CACHE_DURATION
+
+
+DEFAULT_CACHE_POLICY = FixedTTL(_DEFAULT_CACHE_DURATION)
+_policies: Dict[str, CachePolicy] = {}
+# How long past expiry a tool's entry may still be served while it is
+# refreshed in the background (stale-while-revalidate). Absent = disabled.
+_max_stale: Dict[str, timedelta] = {}
+# Tools that fall back to their last good value, however old, when the upstream fails.
+_serve_stale_on_error: set = set()
+
+
+# -------------------------
+# In-memory tier
+# -------------------------
+
+# In-memory first tier. Each tool gets its own bounded LRU so that a tool with
+# many keys (weather for many cities, news for many categories) cannot push
+# the other tools out, and memory stays bounded as keys grow.
+_DEFAULT_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "64"))
+_memory_limits: Dict[str, int] = {}
+_memory: Dict[str, Dict[str, Any]] = {}
+_memory_lock = threading.RLock()
+
+
+def configure_tool_cache(
+    tool_name: str,
+    max_entries: Optional[int] = None,
+    policy: Optional[CachePolicy] = None,
+    max_stale: Optional[timedelta] = None,
+    serve_stale_on_error: Optional[bool] = None,
+):
+    """
+    Configure a tool's cache: how many keys are kept in memory, the expiry
+    policy of written entries, the stale-while-revalidate bound and whether
+    the last good value is served while the upstream is failing.
+    """
+    with _memory_lock:
+        if serve_stale_on_error is not None:
+            if serve_stale_on_error:
+                _serve_stale_on_error.add(tool_name)
+            else:
+                _serve_stale_on_error.discard(tool_name)
+        if policy is not None:
+            _policies[tool_name] = policy
+        if max_stale is not None:
+            _max_stale[tool_name] = max_stale
+        if max_entries is not None:
+            _memory_limits[tool_name] = max(1, int(max_entries))
+            tool_cache = _memory.get(tool_name)
+            if tool_cache is not None:
+                _evict(tool_name, tool_cache)
+
+
+def clear_memory_cache(tool_name: Optional[str] = None):
+    """Drop the in-memory tier; the next lookup reloads it from the store."""
+    with _memory_lock:
+        if tool_name is None:
+            _memory.clear()
+        else:
+            _memory.pop(tool_name, None)
+
+
+# -------------------------
+# Persistent tier
+# -------------------------
+
+# Expired entries are kept this long so stale values can still be served;
+# older ones are swept from the store periodically.
+_RETENTION = timedelta(hours=float(os.getenv("CACHE_RETENTION_HOURS", "24")))
+_SWEEP_INTERVAL = timedelta(minutes=10)
+
+_store: Optional[CacheStore] = None
+_store_lock = threading.Lock()
+_last_sweep: Optional[datetime] = None
+
+
+def _get_store() -> CacheStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store(_CACHE_DIR)
+    return _store
+
+
+def sweep_expired_entries() -> int:
+    """Remove entries from the store that expired longer ago than the retention period."""
+    global _last_sweep
+    now = datetime.now(timezone.utc)
+    _last_sweep = now
+    removed = _get_store().sweep(now - _RETENTION)
+    if removed:
+        print(f"[cache] Swept {removed} expired entries")
+    return removed
+
+
+def _maybe_sweep():
+    if _last_sweep is None or datetime.now(timezone.utc) - _last_sweep >= _SWEEP_INTERVAL:
+        try:
+            sweep_expired_entries()
+        except Exception as e:
+            print(f"[cache] Sweep failed: {e}")
+
+
+def _evict(tool_name: str, tool_cache: Dict[str, Any]):
+    """Trim a tool cache down to its memory limit, least recently used first."""
+    entries = tool_cache["entries"]
+    limit = _memory_limits.get(tool_name, _DEFAULT_MEMORY_MAX_ENTRIES)
+    while len(entries) > limit:
+        entries.popitem(last=False)
+
+
+def _memory_view(tool_name: str) -> Dict[str, Any]:
+    """Return the in-memory view of a tool cache, lazily loading it from the store."""
+    tool_cache = _memory.get(tool_name)
+    if tool_cache is None:
+        limit = _memory_limits.get(tool_name, _DEFAULT_MEMORY_MAX_ENTRIES)
+        tool_cache = {"entries": OrderedDict(_get_store().load(tool_name, limit))}
+        _memory[tool_name] = tool_cache
+    return tool_cache
+
+
+def _remember(tool_name: str, key: str, entry: Dict[str, Any]):
+    with _memory_lock:
+        cache = _memory_view(tool_name)
+        cache["entries"][key] = entry
+        cache["entries"].move_to_end(key)
+        _evict(tool_name, cache)
+
+
+def _get_entry(tool_name: str, key: str) -> Optional[Dict[str, Any]]:
+    """
+    Look up an entry, promoting it to most recently used. Memory misses fall
+    through to the store, which may hold evicted keys or keys written by
+    another worker.
+    """
+    with _memory_lock:
+        entries = _memory_view(tool_name)["entries"]
+        if key in entries:
+            entries.move_to_end(key)
+            return entries[key]
+
+    return _get_stored_entry(tool_name, key)
+
+
+def _get_stored_entry(tool_name: str, key: str) -> Optional[Dict[str, Any]]:
+    """Read an entry straight from the store, bypassing memory, and promote it into memory."""
+    entry = _get_store().get(tool_name, key)
+    if entry is not None:
+        _remember(tool_name, key, entry)
+    return entry
 
-def _load_cache_file(cache_file_path: str) -> Dict[str, Any]:
-    if not os.path.exists(cache_file_path):
-        return {"timestamp": None, "data": {}}
-    try:
-        with open(cache_file_path, "r") as f:
-            cache_data = json.load(f)
-            if cache_data.get("timestamp"):
-                cache_data["timestamp"] = datetime.fromisoformat(cache_data["timestamp"])
-            return cache_data
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"timestamp": None, "data": {}}
-
-def _save_cache_file(cache_file_path: str, cache_data: Dict[str, Any]):
-    os.makedirs(_CACHE_DIR, exist_ok=True)
-    serializable_cache = cache_data.copy()
-    if serializable_cache.get("timestamp"):
-        serializable_cache["timestamp"] = serializable_cache["timestamp"].isoformat()
-    with open(cache_file_path, "w") as f:
-        json.dump(serializable_cache, f, ensure_ascii=False, indent=2)
 
 def get_cached_response(tool_name: str, cache_key: Optional[str] = None) -> Optional[Any]:
-    cache_file_path = _get_cache_file_path(tool_name)
-    cache = _load_cache_file(cache_file_path)
+    entry = _get_entry(tool_name, cache_key or _UNKEYED)
+    if entry is None or datetime.now(timezone.utc) >= entry["expires_at"]:
+        return None
+    return entry["data"]
+
+def set_cached_response(
+    tool_name: str,
+    response_data: Any,
+    cache_key: Optional[str] = None,
+    policy: Optional[CachePolicy] = None,
+):
+    key = cache_key or _UNKEYED
     now = datetime.now(timezone.utc)
+    policy = policy or _policies.get(tool_name, DEFAULT_CACHE_POLICY)
+    entry = {"stored_at": now, "expires_at": policy.expires_at(now), "data": response_data}
+
+    # Write-through: memory first, then a single-key upsert in the store.
+    _remember(tool_name, key, entry)
+    _get_store().put(tool_name, key, entry)
+    _maybe_sweep()
+
+
+# -------------------------
+# Negative caching and upstream backoff
+# -------------------------
+
+# A failed fetch is remembered for this long, so repeated calls fail fast
+# instead of waiting for the same upstream timeout again.
+_NEGATIVE_TTL = timedelta(seconds=float(os.getenv("CACHE_NEGATIVE_TTL_SECONDS", "30")))
+# Consecutive failures of an upstream host back off exponentially between these bounds.
+_BACKOFF_BASE = timedelta(seconds=float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", "5")))
+_BACKOFF_MAX = timedelta(seconds=float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", "300")))
+
+_negative: Dict[tuple, Dict[str, Any]] = {}
+_backoff: Dict[str, Dict[str, Any]] = {}
+_failure_lock = threading.Lock()
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """Raised without contacting the upstream while it is backed off or recently failed."""
+
+
+def _upstream_host(upstream: Optional[str]) -> Optional[str]:
+    if not upstream:
+        return None
+    return urlparse(upstream).hostname or upstream
+
+
+def _check_failures(flight_id: tuple, host: Optional[str]):
+    """Raise UpstreamUnavailable if the key recently failed or its upstream host is backed off."""
+    now = datetime.now(timezone.utc)
+    with _failure_lock:
+        negative = _negative.get(flight_id)
+        if negative is not None:
+            if now < negative["expires_at"]:
+                raise UpstreamUnavailable(f"Recently failed, retrying after {negative['expires_at'].isoformat()}: {negative['error']}")
+            del _negative[flight_id]
+
+        state = _backoff.get(host) if host else None
+        if state is not None and now < state["until"]:
+            raise UpstreamUnavailable(f"{host} is backed off until {state['until'].isoformat()}: {state['error']}")
+
+
+def _http_status(error: Exception) -> Optional[int]:
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None and isinstance(error, requests.exceptions.HTTPError):
+        # raise_for_status() messages start with the status, e.g. "404 Client Error: ..."
+        code = str(error).split(" ", 1)[0]
+        status = int(code) if code.isdigit() else None
+    return status
+
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """
+    Whether an error says the upstream host itself is unhealthy: a transport
+    error, timeout, 5xx or 429. Other errors, e.g. a 404 for one bad key, are not.
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          ConnectionError, TimeoutError)):
+        return True
+    status = _http_status(error)
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(error, requests.exceptions.HTTPError)
 
-    if cache["timestamp"] and (now - cache["timestamp"]) < _DEFAULT_CACHE_DURATION:
-        if cache_key:
-            return cache["data"].get(cache_key)
-        return cache["data"]
-    return None
 
-def set_cached_response(tool_name: str, response_data: Any, cache_key: Optional[str] = None):
-    cache_file_path = _get_cache_file_path(tool_name)
-    cache = _load_cache_file(cache_file_path)
+def _record_failure(flight_id: tuple, host: Optional[str], error: Exception):
     now = datetime.now(timezone.utc)
+    with _failure_lock:
+        _negative[flight_id] = {"expires_at": now + _NEGATIVE_TTL, "error": str(error)}
+        if host and _is_upstream_failure(error):
+            failures = _backoff.get(host, {}).get("failures", 0) + 1
+            delay = min(_BACKOFF_BASE * (2 ** (failures - 1)), _BACKOFF_MAX)
+            _backoff[host] = {"failures": failures, "until": now + delay, "error": str(error)}
+            print(f"[cache] {host} failed {failures} time(s) in a row, backing off for {delay.total_seconds():.0f}s")
 
-    cache["timestamp"] = now
-    if cache_key:
-        if not isinstance(cache["data"], dict):
-            cache["data"] = {}
-        cache["data"][cache_key] = response_data
-    else:
-        cache["data"] = response_data
-    _save_cache_file(cache_file_path, cache)
+
+def _record_success(flight_id: tuple, host: Optional[str]):
+    with _failure_lock:
+        _negative.pop(flight_id, None)
+        if host:
+            _backoff.pop(host, None)
+
+
+# -------------------------
+# Fetch-through with stale-while-revalidate and single-flight
+# -------------------------
+
+_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "4"))
+_refresh_executor = ThreadPoolExecutor(max_workers=_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+
+# One in-flight fetch per (tool, cache_key). Concurrent callers missing the same
+# key wait on the running fetch instead of starting their own.
+_flights: Dict[tuple, Future] = {}
+_flights_lock = threading.Lock()
+
+
+def _is_fresh(entry: Optional[Dict[str, Any]]) -> bool:
+    return entry is not None and datetime.now(timezone.utc) < entry["expires_at"]
+
+
+def _join_flight(tool_name: str, cache_key: Optional[str]):
+    """Return (future, is_leader) for the fetch of a key, starting a new flight if none is running."""
+    flight_id = (tool_name, cache_key or _UNKEYED)
+    with _flights_lock:
+        future = _flights.get(flight_id)
+        if future is not None:
+            return future, False
+        future = Future()
+        _flights[flight_id] = future
+        return future, True
+
+
+def _run_flight(
+    tool_name: str,
+    cache_key: Optional[str],
+    fetch: Callable[[], Any],
+    future: Future,
+    upstream: Optional[str] = None,
+):
+    """Fetch and cache a key as the flight leader, publishing the outcome to every waiter."""
+    flight_id = (tool_name, cache_key or _UNKEYED)
+    host = _upstream_host(upstream)
+    try:
+        # Another flight, or another worker sharing the store, may have filled
+        # the key since our lookup.
+        entry = _get_stored_entry(tool_name, cache_key or _UNKEYED)
+        if _is_fresh(entry):
+            response_data = entry["data"]
+        else:
+            _check_failures(flight_id, host)
+            try:
+                response_data = fetch()
+            except Exception as e:
+                _record_failure(flight_id, host, e)
+                raise
+            _record_success(flight_id, host)
+            set_cached_response(tool_name, response_data, cache_key=cache_key)
+        future.set_result(response_data)
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _flights_lock:
+            _flights.pop(flight_id, None)
+
+
+def _background_refresh(
+    tool_name: str,
+    cache_key: Optional[str],
+    fetch: Callable[[], Any],
+    future: Future,
+    upstream: Optional[str] = None,
+):
+    _run_flight(tool_name, cache_key, fetch, future, upstream)
+    error = future.exception()
+    if error is not None:
+        print(f"[cache] Background refresh of {tool_name}/{cache_key or '-'} failed: {error}")
+
+
+def _schedule_refresh(
+    tool_name: str,
+    cache_key: Optional[str],
+    fetch: Callable[[], Any],
+    upstream: Optional[str] = None,
+):
+    """Refresh an entry in the background unless a fetch for it is already running."""
+    future, is_leader = _join_flight(tool_name, cache_key)
+    if is_leader:
+        _refresh_executor.submit(_background_refresh, tool_name, cache_key, fetch, future, upstream)
+
+
+def get_or_fetch(
+    tool_name: str,
+    fetch: Callable[[], Any],
+    cache_key: Optional[str] = None,
+    upstream: Optional[str] = None,
+) -> Any:
+    """
+    Return the cached response for a tool, calling fetch() on a miss and caching its result.
+    fetch() should raise on failure. Concurrent misses for the same key share
+    a single fetch() call and its result or exception.
+
+    If the tool has a max_stale bound configured, an expired entry younger than
+    that bound is returned immediately and refreshed in the background instead.
+
+    Failures are remembered briefly per key, and repeated transport errors,
+    timeouts, 5xx and 429 responses of the upstream host (a URL or hostname)
+    back off exponentially for every key of that host; during either,
+    UpstreamUnavailable is raised without calling fetch(). Tools configured
+    with serve_stale_on_error get their last good value instead of the error.
+    """
+    entry = _get_entry(tool_name, cache_key or _UNKEYED)
+    if entry is not None:
+        now = datetime.now(timezone.utc)
+        if now < entry["expires_at"]:
+            return entry["data"]
+        max_stale = _max_stale.get(tool_name)
+        if max_stale is not None and now < entry["expires_at"] + max_stale:
+            _schedule_refresh(tool_name, cache_key, fetch, upstream)
+            return entry["data"]
+
+    future, is_leader = _join_flight(tool_name, cache_key)
+    if is_leader:
+        _run_flight(tool_name, cache_key, fetch, future, upstream)
+    try:
+        return future.result()
+    except Exception as e:
+        if entry is None or tool_name not in _serve_stale_on_error:
+            raise
+        print(f"[cache] Serving last good {tool_name}/{cache_key or '-'} from {entry['stored_at'].isoformat()}: {e}")
+        return entry["data"]
@@ -0,0 +1,237 @@
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# A cache entry is a dict with "stored_at" and "expires_at" (aware datetimes) and "data".
+Entry = Dict[str, Any]
+
+
+class CacheStore(ABC):
+    """Persistent tier behind the in-memory tool cache."""
+
+    @abstractmethod
+    def load(self, tool_name: str, limit: int) -> Dict[str, Entry]:
+        """Return up to `limit` most recently stored entries of a tool, oldest first."""
+        pass
+
+    @abstractmethod
+    def get(self, tool_name: str, key: str) -> Optional[Entry]:
+        pass
+
+    @abstractmethod
+    def put(self, tool_name: str, key: str, entry: Entry):
+        pass
+
+    @abstractmethod
+    def sweep(self, expired_before: datetime) -> int:
+        """Delete entries that expired before the given moment. Returns how many were removed."""
+        pass
+
+
+# -------------------------
+# JSON file per tool
+# -------------------------
+
+class JsonFileStore(CacheStore):
+    """
+    One JSON file per tool, rewritten atomically on every put.
+    Safe within one process; use SqliteStore when several workers share the directory.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    def _path(self, tool_name: str) -> str:
+        return os.path.join(self.cache_dir, f"{tool_name}_cache.json")
+
+    def _read(self, tool_name: str) -> Dict[str, Entry]:
+        """Load the entries of a tool cache file. Files in the old single-timestamp layout are ignored."""
+        path = self._path(tool_name)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                cache_data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"[cache] Ignoring unreadable cache file {path}: {e}")
+            return {}
+
+        entries = {}
+        for key, entry in (cache_data.get("entries") or {}).items():
+            try:
+                entries[key] = {
+                    "stored_at": datetime.fromisoformat(entry["stored_at"]),
+                    "expires_at": datetime.fromisoformat(entry["expires_at"]),
+                    "data": entry["data"],
+                }
+            except (KeyError, TypeError, ValueError):
+                continue
+        return entries
+
+    def _write(self, tool_name: str, entries: Dict[str, Entry]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        serializable_cache = {
+            "entries": {
+                key: {
+                    "stored_at": entry["stored_at"].isoformat(),
+                    "expires_at": entry["expires_at"].isoformat(),
+                    "data": entry["data"],
+                }
+                for key, entry in entries.items()
+            }
+        }
+        # Write to a temporary file and rename it over the old one, so a crash
+        # mid-write leaves the previous file intact instead of a truncated one.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{tool_name}_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(serializable_cache, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(tool_name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, tool_name: str, limit: int) -> Dict[str, Entry]:
+        with self._lock:
+            entries = self._read(tool_name)
+        newest = sorted(entries.items(), key=lambda item: item[1]["stored_at"])[-limit:]
+        return dict(newest)
+
+    def get(self, tool_name: str, key: str) -> Optional[Entry]:
+        with self._lock:
+            return self._read(tool_name).get(key)
+
+    def put(self, tool_name: str, key: str, entry: Entry):
+        with self._lock:
+            entries = self._read(tool_name)
+            entries[key] = entry
+            self._write(tool_name, entries)
+
+    def sweep(self, expired_before: datetime) -> int:
+        removed = 0
+        if not os.path.isdir(self.cache_dir):
+            return removed
+        with self._lock:
+            for file_name in os.listdir(self.cache_dir):
+                if not file_name.endswith("_cache.json"):
+                    continue
+                tool_name = file_name[: -len("_cache.json")]
+                entries = self._read(tool_name)
+                kept = {k: e for k, e in entries.items() if e["expires_at"] >= expired_before}
+                if len(kept) != len(entries):
+                    removed += len(entries) - len(kept)
+                    self._write(tool_name, kept)
+        return removed
+
+
+# -------------------------
+# SQLite (WAL)
+# -------------------------
+
+class SqliteStore(CacheStore):
+    """
+    All tool caches in one SQLite database in WAL mode. Writes are per-key
+    upserts, so several uvicorn workers can share the database safely.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    tool TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (tool, key)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_entries_expires_at ON cache_entries (expires_at)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_entries_tool_stored_at ON cache_entries (tool, stored_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_entry(row) -> Entry:
+        stored_at, expires_at, data = row
+        return {
+            "stored_at": datetime.fromtimestamp(stored_at, timezone.utc),
+            "expires_at": datetime.fromtimestamp(expires_at, timezone.utc),
+            "data": json.loads(data),
+        }
+
+    def load(self, tool_name: str, limit: int) -> Dict[str, Entry]:
+        rows = self._connect().execute(
+            "SELECT key, stored_at, expires_at, data FROM cache_entries "
+            "WHERE tool = ? ORDER BY stored_at DESC LIMIT ?",
+            (tool_name, limit),
+        ).fetchall()
+        return {row[0]: self._to_entry(row[1:]) for row in reversed(rows)}
+
+    def get(self, tool_name: str, key: str) -> Optional[Entry]:
+        row = self._connect().execute(
+            "SELECT stored_at, expires_at, data FROM cache_entries WHERE tool = ? AND key = ?",
+            (tool_name, key),
+        ).fetchone()
+        return self._to_entry(row) if row else None
+
+    def put(self, tool_name: str, key: str, entry: Entry):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO cache_entries (tool, key, stored_at, expires_at, data)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (tool, key) DO UPDATE SET
+                    stored_at = excluded.stored_at,
+                    expires_at = excluded.expires_at,
+                    data = excluded.data
+                """,
+                (
+                    tool_name,
+                    key,
+                    entry["stored_at"].timestamp(),
+                    entry["expires_at"].timestamp(),
+                    json.dumps(entry["data"], ensure_ascii=False),
+                ),
+            )
+
+    def sweep(self, expired_before: datetime) -> int:
+        with self._connect() as conn:
+            cur = conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at < ?", (expired_before.timestamp(),))
+            return cur.rowcount
+
+
+def create_store(cache_dir: str) -> CacheStore:
+    """Build the store selected by CACHE_BACKEND ("sqlite" by default, or "json")."""
+    backend = os.getenv("CACHE_BACKEND", "sqlite").lower()
+    if backend == "json":
+        return JsonFileStore(cache_dir)
+    if backend == "sqlite":
+        return SqliteStore(os.path.join(cache_dir, "cache.sqlite3"))
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
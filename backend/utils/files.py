@@ -0,0 +1,37 @@
+import os
+import json
+import fcntl
+import tempfile
+from contextlib import contextmanager
+from typing import Any
+
+
+def write_json_atomic(path: str, data: Any):
+    """Write JSON to path via a temporary file and rename, so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive flock on path, a sidecar lock file created if missing,
+    waiting until other processes release it. Not reentrant: each call opens
+    its own file, so nesting two calls on one path deadlocks.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
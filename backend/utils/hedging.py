@@ -0,0 +1,149 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from openai import OpenAI
+
+from utils.llm import create_chat_completion, get_provider_name
+from utils.rate_limit import RateLimitExceeded, get_rate_limiter
+
+# With LLM_HEDGING=true, a completion the primary provider has not answered
+# within its usual latency is also sent to the other provider, and whichever
+# answers first is used.
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "false").lower() == "true"
+# Percentile of the primary's recent latencies after which the hedge is sent.
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Bounds of the hedge delay, and the delay used until enough latencies are known.
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2"))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+_MIN_SAMPLES = 10
+_MAX_SAMPLES = 200
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+_latencies: Dict[str, Deque[float]] = {}
+_stats: Dict[str, Any] = {"requests": 0, "hedged": 0, "wins": {}, "errors": 0}
+_lock = threading.Lock()
+
+
+def record_latency(provider: str, seconds: float):
+    with _lock:
+        _latencies.setdefault(provider, deque(maxlen=_MAX_SAMPLES)).append(seconds)
+
+
+def hedge_delay(provider: str) -> float:
+    """Seconds to wait for a provider before hedging: HEDGE_PERCENTILE of its recent latencies."""
+    with _lock:
+        samples = sorted(_latencies.get(provider, ()))
+    if len(samples) < _MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_SECONDS
+    index = max(0, math.ceil(HEDGE_PERCENTILE / 100 * len(samples)) - 1)
+    return max(HEDGE_MIN_DELAY_SECONDS, samples[index])
+
+
+def _timed_completion(client: OpenAI, model: str, **kwargs) -> Dict[str, Any]:
+    """Run one leg of a completion and return its outcome instead of raising."""
+    start = time.monotonic()
+    try:
+        response = create_chat_completion(client, model, **kwargs)
+    except Exception as e:
+        return {"response": None, "error": e, "seconds": time.monotonic() - start}
+    seconds = time.monotonic() - start
+    record_latency(get_provider_name(client), seconds)
+    return {"response": response, "error": None, "seconds": seconds}
+
+
+def _record(hedged: bool = False, winner: str = None, error: bool = False):
+    with _lock:
+        if hedged:
+            _stats["hedged"] += 1
+        if winner is not None:
+            _stats["wins"][winner] = _stats["wins"].get(winner, 0) + 1
+        if error:
+            _stats["errors"] += 1
+
+
+def hedged_completion(
+    client: OpenAI,
+    model: str,
+    secondary: Optional[Tuple[OpenAI, str]] = None,
+    **kwargs,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Create a chat completion, hedging it to the secondary (client, model) when
+    LLM_HEDGING is on. If the primary has not answered within hedge_delay(), the
+    same request goes to the secondary and waiting stops at the first successful answer.
+    Streaming requests, and requests without a secondary, are not hedged.
+
+    Returns the outcome of each leg, "primary" and, if a hedge was sent,
+    "secondary": a dict with "response", "error" and "seconds". A leg that was
+    still running when the other answered has neither response nor error.
+    Nothing is raised, so the caller can hold each endpoint to its own outcome.
+    """
+    if not HEDGING_ENABLED or kwargs.get("stream"):
+        secondary = None
+    if secondary is None:
+        return {"primary": _timed_completion(client, model, **kwargs)}
+
+    with _lock:
+        _stats["requests"] += 1
+    primary_name = get_provider_name(client)
+    primary = _executor.submit(_timed_completion, client, model, **kwargs)
+    start = time.monotonic()
+    try:
+        outcome = primary.result(timeout=hedge_delay(primary_name))
+        if outcome["error"] is None:
+            _record(winner=primary_name)
+        else:
+            _record(error=True)
+        return {"primary": outcome}
+    except TimeoutError:
+        pass
+
+    secondary_client, secondary_model = secondary
+    secondary_name = get_provider_name(secondary_client)
+    # The hedge does not queue for the secondary's rate limit; without a free slot it is not sent
+    try:
+        get_rate_limiter(secondary_name, secondary_model).acquire(0)
+    except RateLimitExceeded:
+        outcome = primary.result()
+        _record(winner=primary_name if outcome["error"] is None else None, error=outcome["error"] is not None)
+        return {"primary": outcome}
+    hedge = _executor.submit(_timed_completion, secondary_client, secondary_model, **{**kwargs, "admitted": True})
+    hedge_start = time.monotonic()
+    _record(hedged=True)
+    print(f"[hedging] {primary_name} slower than {hedge_delay(primary_name):.1f}s, also asking {secondary_name}")
+
+    legs = {primary: "primary", hedge: "secondary"}
+    names = {primary: primary_name, hedge: secondary_name}
+    starts = {primary: start, hedge: hedge_start}
+    outcomes = {}
+    pending = set(legs)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            outcomes[legs[future]] = future.result()
+        winner = next((future for future in done if outcomes[legs[future]]["error"] is None), None)
+        if winner is not None:
+            # A request already in flight cannot be interrupted; its answer is discarded
+            for loser in pending:
+                loser.cancel()
+                outcomes[legs[loser]] = {"response": None, "error": None, "seconds": time.monotonic() - starts[loser]}
+            _record(winner=names[winner])
+            return outcomes
+    _record(error=True)
+    return outcomes
+
+
+def hedging_metrics() -> Dict[str, Any]:
+    """Hedge rate, wins per provider and current hedge delays."""
+    with _lock:
+        stats = {**_stats, "wins": dict(_stats["wins"])}
+        providers = list(_latencies)
+    stats["enabled"] = HEDGING_ENABLED
+    stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 3) if stats["requests"] else 0.0
+    stats["hedge_delay_seconds"] = {provider: round(hedge_delay(provider), 2) for provider in providers}
+    return stats
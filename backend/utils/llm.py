@@ -1,12 +1,20 @@
 import os
+import json
+import hashlib
 import time
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict, Any, List
 
+import httpx
 import requests
-from openai import OpenAI
+from openai import APIConnectionError, OpenAI
+from openai.types.chat import ChatCompletion
 from dotenv import load_dotenv
 
+from utils.cache import configure_tool_cache, get_cached_response, get_or_fetch, set_cached_response, FixedTTL
+from utils.rate_limit import MAX_QUEUE_WAIT_SECONDS, RateLimitExceeded, get_rate_limiter
+
 load_dotenv()
 
 OPENROUTER_API = "https://openrouter.ai/api/v1"
@@ -19,8 +27,27 @@ GEMINI_KEY = os.getenv("GEMINI_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
 LLM_PREFER = os.getenv("LLM_PREFER", "gemini").lower()
 
-_cached_model: Optional[str] = None
+# OpenRouter's free models are cached like a tool response: in memory and in the
+# cache store, so a restart does not refetch them, and the last list is used if
+# OpenRouter cannot be reached.
+MODEL_CATALOGUE_CACHE = "openrouter_models"
+MODEL_CATALOGUE_TTL = timedelta(seconds=float(os.getenv("OPENROUTER_MODELS_TTL_SECONDS", "3600")))
+configure_tool_cache(
+    MODEL_CATALOGUE_CACHE,
+    max_entries=1,
+    policy=FixedTTL(MODEL_CATALOGUE_TTL),
+    max_stale=timedelta(days=1),
+    serve_stale_on_error=True,
+)
+
+# How long a model stays blocked when the error does not say when its rate limit resets.
+MODEL_BLOCK_SECONDS = float(os.getenv("OPENROUTER_MODEL_BLOCK_SECONDS", "300"))
+# Models that no longer exist are blocked for much longer.
+MODEL_NOT_FOUND_BLOCK_SECONDS = 24 * 60 * 60
+
+# Model ID -> time.time() until which it is not used.
 _blocked_models: Dict[str, float] = {}
+_blocked_lock = threading.Lock()
 
 
 def _is_free_model(entry: dict) -> bool:
@@ -28,105 +55,157 @@ def _is_free_model(entry: dict) -> bool:
     return bool(entry.get("free")) or mid.endswith(":free")
 
 
-def get_best_free_model(force_provider: Optional[str] = None) -> str:
-    """
-    Fetch best available free model from OpenRouter (largest context first).
-    Optional force_provider: e.g., "deepseek", "gemini", "meta" to bias selection.
-    """
-    global _cached_model
+def _fetch_free_models() -> List[Dict[str, Any]]:
+    res = requests.get(f"{OPENROUTER_API}/models", timeout=10)
+    res.raise_for_status()
+    data = res.json().get("data", [])
+    return [
+        {"id": m["id"], "context_length": m.get("context_length") or 0}
+        for m in data if _is_free_model(m)
+    ]
 
-    if _cached_model and _cached_model not in _blocked_models:
-        if not force_provider or force_provider.lower() in _cached_model.lower():
-            return _cached_model
 
-    try:
-        res = requests.get(f"{OPENROUTER_API}/models", timeout=10)
-        res.raise_for_status()
-        data = res.json().get("data", [])
-
-        free_models = [
-            m for m in data if _is_free_model(m) and m["id"] not in _blocked_models
-        ]
-        if not free_models:
-            print("[OpenRouter] No free models found — using fallback.")
-            _cached_model = "gpt-4o-mini"
-            return _cached_model
-
-        candidates = free_models
-        if force_provider:
-            preferred = [
-                m for m in free_models if force_provider.lower() in m["id"].lower()
-            ]
-            if preferred:
-                candidates = preferred
-
-        candidates.sort(key=lambda m: m.get("context_length", 0), reverse=True)
-        _cached_model = candidates[0]["id"]
-        print(f"[OpenRouter] Selected free model: {_cached_model}")
-        return _cached_model
+def is_model_blocked(model_id: str) -> bool:
+    """Whether a model is blocked; blocks expire on their own."""
+    with _blocked_lock:
+        until = _blocked_models.get(model_id)
+        if until is None:
+            return False
+        if time.time() >= until:
+            del _blocked_models[model_id]
+            print(f"[OpenRouter] Model '{model_id}' unblocked.")
+            return False
+        return True
 
+
+def get_ranked_free_models(force_provider: Optional[str] = None) -> List[str]:
+    """
+    Free OpenRouter models that are not blocked, best first (largest context,
+    models matching force_provider ahead of the rest). The catalogue comes
+    from the cache, so failing over to the next model does not refetch it.
+    """
+    try:
+        free_models = get_or_fetch(MODEL_CATALOGUE_CACHE, _fetch_free_models, upstream=OPENROUTER_API)
     except Exception as e:
         print(f"[OpenRouter] Error fetching models: {e}")
-        _cached_model = "gpt-4o-mini"
-        return _cached_model
-
+        return []
 
-def mark_model_blocked(model_id: str) -> None:
-    _blocked_models[model_id] = time.time()
-    print(
-        f"[OpenRouter] Model '{model_id}' marked as blocked (rate/quota/deprecated).")
+    provider = (force_provider or "").lower()
+    ranked = sorted(
+        free_models,
+        key=lambda m: (not provider or provider in m["id"].lower(), m["context_length"]),
+        reverse=True,
+    )
+    return [m["id"] for m in ranked if not is_model_blocked(m["id"])]
 
 
-def get_openrouter_client_and_model(
-    force_provider: Optional[str] = None,
-) -> Tuple[OpenAI, str]:
+def mark_model_blocked(model_id: str, reset_ts_ms: Optional[int] = None, seconds: Optional[float] = None) -> None:
     """
-    Returns OpenAI-compatible client for OpenRouter + best free model.
+    Stop using a model until its rate limit resets (X-RateLimit-Reset, in ms),
+    or for `seconds`, or for MODEL_BLOCK_SECONDS.
     """
-    if not OPENROUTER_KEY:
-        raise ValueError("Missing environment variable: OPENROUTER_KEY")
-
-    client = OpenAI(
-        api_key=OPENROUTER_KEY,
-        base_url=OPENROUTER_API,
-        default_headers={
-            "HTTP-Referer": "http://localhost:5173",
-            "X-Title": "My Python LLM App",
-        },
-    )
-    model = OPENROUTER_MODEL or get_best_free_model(
-        force_provider=force_provider)
-    return client, model
+    if reset_ts_ms is not None:
+        until = reset_ts_ms / 1000.0
+    else:
+        until = time.time() + (seconds if seconds is not None else MODEL_BLOCK_SECONDS)
+    with _blocked_lock:
+        _blocked_models[model_id] = max(until, _blocked_models.get(model_id, 0))
+    print(
+        f"[OpenRouter] Model '{model_id}' blocked until {datetime.fromtimestamp(until).isoformat()} (rate/quota/deprecated).")
 
 
-def get_gemini_client_and_model(model: Optional[str] = None) -> Tuple[OpenAI, str]:
+# -------------------------
+# Shared clients
+# -------------------------
+
+# Connection pool and timeouts of the shared LLM clients.
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "120"))
+
+_clients: Dict[tuple, OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_shared_client(api_key: str, base_url: str, default_headers: Optional[Dict[str, str]] = None) -> OpenAI:
     """
-    Returns an OpenAI-compatible client for Gemini using the OpenAI bridge endpoint.
+    One OpenAI-compatible client per base URL, key and headers for the whole
+    process, so its keep-alive connection pool is reused across calls.
     """
-    if not GEMINI_KEY:
-        raise ValueError("Missing environment variable: GEMINI_KEY")
-
-    client = OpenAI(
-        api_key=GEMINI_KEY,
-        base_url=GEMINI_BASE_URL,
-    )
-    return client, (model or GEMINI_MODEL)
+    key = (base_url, api_key, tuple(sorted((default_headers or {}).items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                default_headers=default_headers,
+                # No SDK retries: it would sleep through 429s (up to Retry-After) in the
+                # calling thread before the rate limiter or router saw them. The router
+                # fails over instead.
+                max_retries=0,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                    ),
+                    timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+                ),
+            )
+        return client
+
+
+def close_clients():
+    """Close the connection pools of all shared clients. Called when the app shuts down."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"[LLM] Failed to close client for {client.base_url}: {e}")
+
+
+def get_provider_client(provider: str) -> OpenAI:
+    """The shared client of "gemini" or "openrouter"."""
+    if provider == "gemini":
+        if not GEMINI_KEY:
+            raise ValueError("Missing environment variable: GEMINI_KEY")
+        return get_shared_client(GEMINI_KEY, GEMINI_BASE_URL)
+    if provider == "openrouter":
+        if not OPENROUTER_KEY:
+            raise ValueError("Missing environment variable: OPENROUTER_KEY")
+        return get_shared_client(
+            OPENROUTER_KEY,
+            OPENROUTER_API,
+            default_headers={
+                "HTTP-Referer": "http://localhost:5173",
+                "X-Title": "My Python LLM App",
+            },
+        )
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def get_provider_name(client: OpenAI) -> str:
+    """Name of the provider an OpenAI-compatible client talks to: "gemini", "openrouter" or its host."""
+    base_url = str(client.base_url)
+    if base_url.startswith(GEMINI_BASE_URL):
+        return "gemini"
+    if base_url.startswith(OPENROUTER_API):
+        return "openrouter"
+    return client.base_url.host
 
 
 # -------------------------
-# Rate limit handling (OpenRouter)
+# Rate limit handling
 # -------------------------
 
-class RateLimitExceeded(Exception):
-    def __init__(self, reset_ts_ms: Optional[int], message: str = "Rate limit exceeded"):
-        self.reset_ts_ms = reset_ts_ms
-        super().__init__(message)
-
-    @property
-    def reset_time(self) -> Optional[datetime]:
-        if self.reset_ts_ms is None:
-            return None
-        return datetime.fromtimestamp(self.reset_ts_ms / 1000.0)
+# How long a provider and model admit nothing after a 429 that does not say when the limit resets.
+RATE_LIMIT_PAUSE_SECONDS = 10
 
 
 def _parse_reset_ms(headers) -> Optional[int]:
@@ -145,101 +224,120 @@ def _remaining_quota(headers) -> Optional[int]:
         return None
 
 
-def chat_with_rate_limit(
-    client: OpenAI,
-    model: str,
-    messages: List[Dict[str, str]],
-    block_until_reset: bool = False,
-    max_wait_seconds: int = 3600,
-    **kwargs,
-):
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_model_not_found(error: Exception) -> bool:
+    return _status_code(error) == 404 or "model_not_found" in str(error).lower()
+
+
+def is_upstream_failure(error: Exception) -> bool:
     """
-    Chat completion with rate-limit handling for OpenRouter.
-    On 429 or exhausted quota:
-      - If block_until_reset=True and reset is known, sleeps (up to max_wait_seconds) and retries once.
-      - Else raises RateLimitExceeded with reset timestamp so caller can queue/switch.
+    Whether an error says the provider itself is unhealthy: a connection error,
+    timeout, 5xx or 429. A 4xx for one bad request (400, 401, 403, 422) is not.
     """
-    try:
-        resp = client.chat.completions.create(
-            model=model, messages=messages, **kwargs)
-        return resp
-    except Exception as e:
-        text = str(e).lower()
+    if isinstance(error, (APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    status = _status_code(error)
+    return status is not None and (status >= 500 or status == 429)
 
-        reset_ms = None
-        remaining = None
-        response = getattr(e, "response", None)
-        if response is not None:
-            try:
-                headers = response.headers or {}
-                reset_ms = _parse_reset_ms(headers)
-                remaining = _remaining_quota(headers)
-            except Exception:
-                pass
-
-        is_rl = "rate limit" in text or "quota" in text or "429" in text
-        if is_rl or remaining == 0:
-            if block_until_reset and reset_ms:
-                wait_s = max(0, int(reset_ms / 1000) - int(time.time()))
-                wait_s = min(wait_s, max_wait_seconds)
-                if wait_s > 0:
-                    human = datetime.fromtimestamp(
-                        time.time() + wait_s).isoformat()
-                    print(
-                        f"[OpenRouter] Rate limit hit. Waiting {wait_s}s (until {human})...")
-                    time.sleep(wait_s)
-                    return client.chat.completions.create(
-                        model=model, messages=messages, **kwargs
-                    )
-
-            mark_model_blocked(model)
-            raise RateLimitExceeded(reset_ms, message=str(e)) from e
 
-        if "model_not_found" in text or "not found" in text or "404" in text:
-            global _cached_model
-            _cached_model = None
-            mark_model_blocked(model)
-            raise
+# -------------------------
+# Completion cache
+# -------------------------
 
-        raise
+# Non-streaming completions are cached by an exact hash of the request, so an
+# identical prompt (a retry, or a rerun on unchanged data) is answered without
+# calling the provider. Entries live in the tool cache, bounded in memory by
+# LLM_COMPLETION_CACHE_MAX_ENTRIES and expiring after LLM_COMPLETION_CACHE_TTL_SECONDS.
+COMPLETION_CACHE_ENABLED = os.getenv("LLM_COMPLETION_CACHE", "true").lower() == "true"
+COMPLETION_CACHE = "llm_completions"
+configure_tool_cache(
+    COMPLETION_CACHE,
+    max_entries=int(os.getenv("LLM_COMPLETION_CACHE_MAX_ENTRIES", "256")),
+    policy=FixedTTL(timedelta(seconds=float(os.getenv("LLM_COMPLETION_CACHE_TTL_SECONDS", "3600")))),
+)
 
+_completion_cache_stats = {"hits": 0, "misses": 0}
+_completion_cache_lock = threading.Lock()
 
-def get_client_and_model(
-    # "gemini" or "openrouter"; overrides env if provided
-    prefer: Optional[str] = None,
-    # bias OpenRouter model selection, e.g., "deepseek"
-    force_provider: Optional[str] = None,
-) -> Tuple[OpenAI, str]:
-    """
-    Returns a single OpenAI-compatible client and model, preferring provider
-    based on env LLM_PREFER (or 'prefer' arg), with fallback to the other.
-    """
-    choice = (prefer or LLM_PREFER).lower()
-    print(choice)
-    # Try preferred provider first
-    if choice == "gemini" and GEMINI_KEY:
-        try:
-            return get_gemini_client_and_model()
-        except Exception as e:
-            print(
-                f"[Gemini] Preferred failed: {e}. Falling back to OpenRouter...")
 
-    if choice == "openrouter" and OPENROUTER_KEY:
-        try:
-            return get_openrouter_client_and_model(force_provider=force_provider)
-        except Exception as e:
-            print(
-                f"[OpenRouter] Preferred failed: {e}. Falling back to Gemini...")
+def completion_cache_key(model: str, request: Dict[str, Any]) -> str:
+    """Hash of the model, messages, tools and sampling parameters of a completion request."""
+    canonical = json.dumps({"model": model, **request}, sort_keys=True, ensure_ascii=False,
+                           separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
-    # Fallback to whichever is available
-    if GEMINI_KEY:
-        try:
-            return get_gemini_client_and_model()
-        except Exception as e:
-            print(f"[Gemini] Fallback failed: {e}")
 
-    if OPENROUTER_KEY:
-        return get_openrouter_client_and_model(force_provider=force_provider)
-    print("KEY IS: ", GEMINI_KEY)
-    raise RuntimeError(
-        "No available provider. Set GEMINI_KEY and/or OPENROUTER_KEY.")
+def get_cached_completion(models: List[str], request: Dict[str, Any]) -> Optional[Tuple[str, ChatCompletion]]:
+    """
+    The first of models with a cached response to an identical request, and that
+    response including its tool_calls, or None. Counts as one hit or miss however
+    many models are tried. The replayed response has no usage, since it cost no
+    tokens. Streaming requests are never cached.
+    """
+    if not COMPLETION_CACHE_ENABLED or request.get("stream"):
+        return None
+    found = None
+    for model in dict.fromkeys(models):
+        data = get_cached_response(COMPLETION_CACHE, cache_key=completion_cache_key(model, request))
+        if data is not None:
+            found = model, ChatCompletion.model_validate({**data, "usage": None})
+            break
+    with _completion_cache_lock:
+        _completion_cache_stats["hits" if found is not None else "misses"] += 1
+    return found
+
+
+def cache_completion(model: str, request: Dict[str, Any], response: ChatCompletion):
+    if not COMPLETION_CACHE_ENABLED or request.get("stream"):
+        return
+    set_cached_response(COMPLETION_CACHE, response.model_dump(mode="json"),
+                        cache_key=completion_cache_key(model, request))
+
+
+def completion_cache_metrics() -> Dict[str, Any]:
+    with _completion_cache_lock:
+        stats = dict(_completion_cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["enabled"] = COMPLETION_CACHE_ENABLED
+    return stats
+
+
+def create_chat_completion(client: OpenAI, model: str, max_wait: float = MAX_QUEUE_WAIT_SECONDS,
+                           admitted: bool = False, **kwargs):
+    """
+    Create a chat completion once the provider and model's shared rate limiter
+    admits it (see utils/rate_limit.py), and feed the response's
+    X-RateLimit-* headers back into the limiter. Non-streaming responses are
+    stored in the completion cache; callers look them up first with
+    get_cached_completion (route_chat_completion does).
+    Raises RateLimitExceeded if no slot comes up within max_wait, or if the
+    provider answers 429 or reports an exhausted quota. With admitted=True the
+    caller has already taken the slot.
+    """
+    limiter = get_rate_limiter(get_provider_name(client), model)
+    if not admitted:
+        limiter.acquire(max_wait)
+    try:
+        raw = client.chat.completions.with_raw_response.create(model=model, **kwargs)
+    except Exception as e:
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        reset_ms = _parse_reset_ms(headers)
+        if headers:
+            limiter.observe(headers)
+        if _status_code(e) == 429 or _remaining_quota(headers) == 0:
+            limiter.close_until(reset_ms, seconds=RATE_LIMIT_PAUSE_SECONDS)
+            raise RateLimitExceeded(reset_ms, message=str(e)) from e
+        raise
+    limiter.observe(raw.headers)
+    response = raw.parse()
+    cache_completion(model, kwargs, response)
+    return response
@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+# Default admission rate per provider and model, e.g. OpenRouter's free tier
+# allows 20 requests a minute. Override per provider with LLM_RATE_LIMIT_RPM_GEMINI etc.
+DEFAULT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "20"))
+# Requests that may be sent back to back before the rate applies.
+DEFAULT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "5"))
+# Longest a caller waits in the queue. Callers that would wait longer fail
+# straight away with RateLimitExceeded, so they can switch model or provider.
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, reset_ts_ms: Optional[int], message: str = "Rate limit exceeded"):
+        self.reset_ts_ms = reset_ts_ms
+        super().__init__(message)
+
+    @property
+    def reset_time(self) -> Optional[datetime]:
+        if self.reset_ts_ms is None:
+            return None
+        return datetime.fromtimestamp(self.reset_ts_ms / 1000.0)
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except Exception:
+        return None
+
+
+class RateLimiter:
+    """
+    Token bucket for one provider and model. Callers queue in arrival order
+    and are admitted as tokens refill. The quota reported in X-RateLimit-*
+    response headers caps the bucket, and an exhausted quota closes it until
+    X-RateLimit-Reset.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, burst: int):
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        # time.time() until which nothing is admitted
+        self.closed_until = 0.0
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _time_until_admission(self) -> float:
+        """Seconds until the caller at the head of the queue can be admitted."""
+        closed_for = max(0.0, self.closed_until - time.time())
+        refill_for = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(closed_for, refill_for)
+
+    def _reset_ms(self) -> Optional[int]:
+        return int(self.closed_until * 1000) if self.closed_until > time.time() else None
+
+    def acquire(self, max_wait: float = MAX_QUEUE_WAIT_SECONDS) -> float:
+        """
+        Wait for a turn to send one request and return how long that took.
+        Raises RateLimitExceeded if the turn would not come within max_wait.
+        """
+        start = time.monotonic()
+        deadline = start + max_wait
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            try:
+                while True:
+                    self._refill()
+                    at_head = self._queue[0] is ticket
+                    wait = self._time_until_admission() if at_head else deadline - time.monotonic()
+                    if at_head and wait <= 0:
+                        self.tokens -= 1
+                        waited = time.monotonic() - start
+                        self.admitted += 1
+                        self.total_wait += waited
+                        self.max_wait = max(self.max_wait, waited)
+                        return waited
+                    if time.monotonic() + (wait if at_head else 0) > deadline:
+                        self.rejected += 1
+                        raise RateLimitExceeded(
+                            self._reset_ms(), message=f"{self.name}: no request slot within {max_wait:.0f}s")
+                    self._cond.wait(wait)
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def close_until(self, reset_ts_ms: Optional[int] = None, seconds: Optional[float] = None):
+        """Admit nothing until reset_ts_ms (epoch milliseconds) or for `seconds`."""
+        until = reset_ts_ms / 1000.0 if reset_ts_ms is not None else time.time() + (seconds or 0)
+        with self._cond:
+            self.closed_until = max(self.closed_until, until)
+            self._cond.notify_all()
+
+    def observe(self, headers):
+        """Update the bucket from a response's X-RateLimit-Limit, -Remaining and -Reset headers."""
+        limit = _int_header(headers, "X-RateLimit-Limit")
+        remaining = _int_header(headers, "X-RateLimit-Remaining")
+        reset_ms = _int_header(headers, "X-RateLimit-Reset")
+        with self._cond:
+            if limit is not None:
+                self.limit = limit
+            if remaining is not None:
+                self.remaining = remaining
+                self._refill()
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining == 0 and reset_ms is not None:
+                    self.closed_until = max(self.closed_until, reset_ms / 1000.0)
+            self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill()
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait / self.admitted * 1000) if self.admitted else 0,
+                "max_wait_ms": round(self.max_wait * 1000),
+                "tokens": round(self.tokens, 2),
+                "remaining": self.remaining,
+                "limit": self.limit,
+                "closed_until": datetime.fromtimestamp(self.closed_until).isoformat()
+                if self.closed_until > time.time() else None,
+            }
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """The shared limiter of a provider and model, created on first use."""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            rpm = float(os.getenv(f"LLM_RATE_LIMIT_RPM_{provider.upper()}", DEFAULT_RPM))
+            limiter = _limiters[key] = RateLimiter(f"{provider}/{model}", rpm, DEFAULT_BURST)
+        return limiter
+
+
+def rate_limit_metrics() -> Dict[str, Dict[str, Any]]:
+    """Queue and quota metrics of every limiter, by "provider/model"."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.metrics() for limiter in limiters}
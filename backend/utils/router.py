@@ -0,0 +1,242 @@
+import os
+import random
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.llm import (
+    GEMINI_KEY, GEMINI_MODEL, LLM_PREFER, MODEL_NOT_FOUND_BLOCK_SECONDS, OPENROUTER_KEY, OPENROUTER_MODEL,
+    RateLimitExceeded, get_cached_completion, get_provider_client, get_ranked_free_models,
+    is_model_not_found, is_upstream_failure, mark_model_blocked,
+)
+from utils.hedging import hedged_completion
+
+# Weight of the newest sample in the latency and error-rate averages.
+EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.3"))
+# Consecutive failures that open an endpoint's circuit, and how long it stays open
+# before one trial request is let through (half-open).
+BREAKER_FAILURES = int(os.getenv("LLM_ROUTER_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_ROUTER_BREAKER_COOLDOWN_SECONDS", "30"))
+# Latency assumed for an endpoint that has not answered yet, so untried endpoints are not always picked first.
+UNKNOWN_LATENCY_SECONDS = 5.0
+# Share of completions sent to a random other healthy endpoint, so the
+# latency of endpoints that are not currently the fastest stays known.
+EXPLORE_RATE = float(os.getenv("LLM_ROUTER_EXPLORE_RATE", "0.05"))
+# How many of the ranked free OpenRouter models are routing candidates.
+OPENROUTER_CANDIDATES = 3
+# Endpoints tried for one completion before giving up.
+MAX_ATTEMPTS = 3
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class EndpointHealth:
+    """Latency, error rate and circuit-breaker state of one provider and model."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.state = CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.calls = 0
+
+    def available(self, now: float) -> bool:
+        if self.state == OPEN and now >= self.open_until:
+            self.state = HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == HALF_OPEN:
+            return not self.trial_in_flight
+        return self.state == CLOSED
+
+    def score(self, error_penalty: float = 4.0) -> float:
+        """Expected cost of a call: latency, inflated by the recent error rate."""
+        latency = self.latency if self.latency is not None else UNKNOWN_LATENCY_SECONDS
+        return latency * (1 + error_penalty * self.error_rate)
+
+    def record_success(self, seconds: float):
+        self.calls += 1
+        self.latency = seconds if self.latency is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate
+        self.failures = 0
+        self.state = CLOSED
+        self.trial_in_flight = False
+
+    def record_slow(self, seconds: float):
+        """Fold in a call that was still running after `seconds`, e.g. one a hedge overtook."""
+        if self.latency is None or seconds > self.latency:
+            self.latency = seconds if self.latency is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+
+    def record_failure(self, open_until: Optional[float] = None):
+        self.calls += 1
+        self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= BREAKER_FAILURES or open_until:
+            self.state = OPEN
+            self.open_until = max(open_until or 0, time.time() + BREAKER_COOLDOWN_SECONDS)
+            print(f"[router] Circuit open for {self.provider}/{self.model} "
+                  f"for {self.open_until - time.time():.0f}s")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "state": self.state,
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.failures,
+            "calls": self.calls,
+        }
+
+
+_health: Dict[Tuple[str, str], EndpointHealth] = {}
+_lock = threading.Lock()
+
+
+def _candidates() -> List[Tuple[str, str]]:
+    """(provider, model) pairs that can serve a completion, in LLM_PREFER order."""
+    candidates = []
+    if GEMINI_KEY:
+        candidates.append(("gemini", GEMINI_MODEL))
+    if OPENROUTER_KEY:
+        models = [OPENROUTER_MODEL] if OPENROUTER_MODEL else get_ranked_free_models()[:OPENROUTER_CANDIDATES]
+        candidates += [("openrouter", model) for model in models]
+    candidates.sort(key=lambda candidate: candidate[0] != LLM_PREFER)
+    return candidates
+
+
+def _ranked_endpoints() -> List[EndpointHealth]:
+    """Available endpoints, cheapest expected call first."""
+    candidates = _candidates()
+    now = time.time()
+    with _lock:
+        endpoints = [_health.setdefault(key, EndpointHealth(*key)) for key in candidates]
+        available = [endpoint for endpoint in endpoints if endpoint.available(now)]
+    # sorted() is stable, so equal scores keep the LLM_PREFER order
+    return sorted(available, key=lambda endpoint: endpoint.score())
+
+
+def _explore(endpoints: List[EndpointHealth]) -> List[EndpointHealth]:
+    """Occasionally move a random endpoint other than the fastest to the front."""
+    if len(endpoints) > 1 and random.random() < EXPLORE_RATE:
+        chosen = random.choice(endpoints[1:])
+        return [chosen] + [endpoint for endpoint in endpoints if endpoint is not chosen]
+    return endpoints
+
+
+def _hedge_target(endpoints: List[EndpointHealth], primary: EndpointHealth) -> Optional[EndpointHealth]:
+    """The fastest closed-circuit endpoint of another provider, to hedge a call to primary with."""
+    with _lock:
+        for endpoint in endpoints:
+            if endpoint.provider != primary.provider and endpoint.state == CLOSED:
+                return endpoint
+    return None
+
+
+def _record_error(endpoint: EndpointHealth, error: Exception) -> bool:
+    """
+    Hold an endpoint to a failed call, unless the failure was not the endpoint's.
+    Returns whether another endpoint may succeed where this one failed.
+    """
+    if isinstance(error, RateLimitExceeded):
+        # A full local queue is not the endpoint's fault; a refusal from the provider is
+        if error.__cause__ is None:
+            with _lock:
+                endpoint.trial_in_flight = False
+            return True
+        if endpoint.provider == "openrouter":
+            mark_model_blocked(endpoint.model, error.reset_ts_ms)
+        with _lock:
+            endpoint.record_failure(error.reset_ts_ms / 1000.0 if error.reset_ts_ms else None)
+        return True
+    if is_upstream_failure(error):
+        with _lock:
+            endpoint.record_failure()
+        return True
+    # The request itself was refused (bad request, auth, context length); it
+    # says nothing about the endpoint's health
+    with _lock:
+        endpoint.trial_in_flight = False
+    if endpoint.provider == "openrouter" and is_model_not_found(error):
+        mark_model_blocked(endpoint.model, seconds=MODEL_NOT_FOUND_BLOCK_SECONDS)
+        return True
+    return False
+
+
+def route_chat_completion(**kwargs) -> Tuple[Any, EndpointHealth]:
+    """
+    Create a chat completion on the fastest healthy endpoint, failing over to
+    the next one if it errors, and hedged to the fastest healthy endpoint of the
+    other provider when LLM_HEDGING is on. Returns the response and the endpoint
+    that served it. Latency is measured to the response, or to the start of the
+    stream with stream=True.
+    """
+    errors = []
+    ranked = _ranked_endpoints()
+    attempts = _explore(ranked)[:MAX_ATTEMPTS]
+    # Looked up once for all the endpoints that may be tried; a cached answer
+    # says nothing about the endpoint's health
+    cached = get_cached_completion([endpoint.model for endpoint in attempts], kwargs)
+    if cached is not None:
+        model, response = cached
+        return response, next(endpoint for endpoint in attempts if endpoint.model == model)
+    for endpoint in attempts:
+        with _lock:
+            if not endpoint.available(time.time()):
+                continue
+            if endpoint.state == HALF_OPEN:
+                endpoint.trial_in_flight = True
+        hedge = _hedge_target(ranked, endpoint)
+        secondary = (get_provider_client(hedge.provider), hedge.model) if hedge else None
+        outcomes = hedged_completion(
+            get_provider_client(endpoint.provider), endpoint.model, secondary=secondary, **kwargs)
+
+        served = None
+        retryable = True
+        for leg, leg_endpoint in (("primary", endpoint), ("secondary", hedge)):
+            outcome = outcomes.get(leg)
+            if outcome is None:
+                continue
+            if outcome["response"] is not None:
+                with _lock:
+                    leg_endpoint.record_success(outcome["seconds"])
+                served = outcome["response"], leg_endpoint
+            elif outcome["error"] is not None:
+                failover = _record_error(leg_endpoint, outcome["error"])
+                if leg == "primary":
+                    retryable = failover
+            else:
+                # Overtaken while still running; its latency is at least as long as the wait
+                with _lock:
+                    leg_endpoint.record_slow(outcome["seconds"])
+                    leg_endpoint.trial_in_flight = False
+        if served is not None:
+            return served
+        # The primary's error is the one that explains the failure; the hedge's
+        # may only be that it found no free rate-limit slot
+        error = outcomes["primary"]["error"]
+        print(f"[router] {endpoint.provider}/{endpoint.model} failed: {error}")
+        if not retryable:
+            # A refused request (400, 401, 403, 422) goes back to the caller rather than round every endpoint
+            raise error
+        errors.append(error)
+
+    if errors:
+        # Prefer an upstream failure over a local "no free slot" from a later attempt
+        upstream = [e for e in errors if not (isinstance(e, RateLimitExceeded) and e.__cause__ is None)]
+        raise (upstream or errors)[-1]
+    raise RuntimeError("No available LLM endpoint. Set GEMINI_KEY and/or OPENROUTER_KEY, or wait for a circuit to close.")
+
+
+def router_metrics() -> List[Dict[str, Any]]:
+    """Health of every endpoint the router has seen, cheapest first."""
+    now = time.time()
+    with _lock:
+        endpoints = list(_health.values())
+        for endpoint in endpoints:
+            endpoint.available(now)
+        return [endpoint.to_dict() for endpoint in sorted(endpoints, key=lambda endpoint: endpoint.score())]